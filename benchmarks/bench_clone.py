@@ -0,0 +1,88 @@
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from extract_code import clone_repo, extract_python_members
+
+
+def git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def make_bare_repo(root: Path, py_files: int, blob_mb: int, commits: int) -> Path:
+    """A repo shaped like an ML project: small .py files, large binary blobs."""
+    work = root / "work"
+    work.mkdir()
+    git("init", "-q", str(work))
+    git("config", "user.email", "bench@example.com", cwd=work)
+    git("config", "user.name", "bench", cwd=work)
+    for commit in range(commits):
+        for i in range(py_files):
+            pkg = work / "src" / f"pkg{i % 10}"
+            pkg.mkdir(parents=True, exist_ok=True)
+            (pkg / f"module_{i}.py").write_text(
+                f"import matplotlib.pyplot as plt\n# revision {commit}\n"
+                + "x = [i * i for i in range(100)]\n" * 20
+            )
+        (work / "checkpoints").mkdir(exist_ok=True)
+        (work / "checkpoints" / f"model_{commit}.bin").write_bytes(
+            os.urandom(blob_mb << 20)
+        )
+        (work / "notebook.ipynb").write_text('{"cells": []}\n' * (commit + 1) * 1000)
+        git("add", "-A", cwd=work)
+        git("commit", "-q", "-m", f"commit {commit}", cwd=work)
+    bare = root / "repo.git"
+    git("clone", "-q", "--bare", str(work), str(bare))
+    git("config", "uploadpack.allowFilter", "true", cwd=bare)
+    git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=bare)
+    return bare
+
+
+def disk_usage(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="clone_repo modes against a local bare repo")
+    parser.add_argument("--py-files", type=int, default=200)
+    parser.add_argument("--blob-mb", type=int, default=8)
+    parser.add_argument("--commits", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        bare = make_bare_repo(root, args.py_files, args.blob_mb, args.commits)
+        url = bare.resolve().as_uri()  # file:// so partial clone filters apply
+
+        for mode in ("full", "sparse"):
+            dest = root / f"clone-{mode}"
+            dest.mkdir()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                path = clone_repo(url, dest, mode=mode)
+            elapsed = time.perf_counter() - start
+            py_count = len(list(path.rglob("*.py")))
+            print(f"{mode:<8} {elapsed:6.2f}s  {disk_usage(path) / 1e6:8.2f} MB  {py_count} .py files")
+
+        archive = root / "repo.tar.gz"
+        git("archive", "--format=tar.gz", "--prefix=repo-HEAD/", "-o", str(archive), "HEAD", cwd=bare)
+        dest = root / "clone-tarball" / "repo"
+        dest.mkdir(parents=True)
+        start = time.perf_counter()
+        with open(archive, "rb") as f:
+            extract_python_members(f, dest)
+        elapsed = time.perf_counter() - start
+        py_count = len(list(dest.rglob("*.py")))
+        print(
+            f"tarball  {elapsed:6.2f}s  {disk_usage(dest) / 1e6:8.2f} MB  {py_count} .py files"
+            f"  (streamed {archive.stat().st_size / 1e6:.2f} MB archive)"
+        )
+
+
+if __name__ == "__main__":
+    main()
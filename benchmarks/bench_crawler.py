@@ -0,0 +1,60 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.fake_server import FakePapersWithCode
+from crawler import crawl_paperswithcode
+from http_client import HttpClient
+
+
+def run(num_pages, concurrency, papers_per_page, latency, recrawl=False):
+    with FakePapersWithCode(papers_per_page, latency) as fake, tempfile.TemporaryDirectory() as tmp:
+        output_csv = os.path.join(tmp, "crawled_links.csv")
+        client = HttpClient()
+
+        def crawl():
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                crawl_paperswithcode(
+                    num_pages,
+                    output_csv,
+                    os.path.join(tmp, "PDFs"),
+                    concurrency=concurrency,
+                    rate=0,
+                    base_url=fake.latest_url,
+                    client=client,
+                )
+
+        if recrawl:
+            crawl()
+            fake.requests = 0
+        start = time.perf_counter()
+        crawl()
+        elapsed = time.perf_counter() - start
+        return elapsed, fake.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawler throughput against a local fake server")
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--papers-per-page", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        elapsed, requests = run(args.pages, concurrency, args.papers_per_page, args.latency)
+        papers = args.pages * args.papers_per_page
+        print(
+            f"concurrency={concurrency:<3} {elapsed:7.2f}s  "
+            f"{requests / elapsed:8.1f} req/s  {papers / elapsed:7.1f} papers/s"
+        )
+
+    elapsed, requests = run(args.pages, max(args.concurrency), args.papers_per_page, args.latency, recrawl=True)
+    print(f"unchanged re-crawl  {elapsed:7.2f}s  {requests} requests (conditional GETs)")
+
+
+if __name__ == "__main__":
+    main()
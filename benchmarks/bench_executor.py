@@ -0,0 +1,69 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from code_executor import CodeExecutor
+
+SCRIPT = """
+import numpy as np
+import matplotlib.pyplot as plt
+
+x = np.linspace(0, 10, 200)
+fig, ax = plt.subplots(figsize=(5, 3.5))
+for k in range(3):
+    ax.plot(x, np.sin(x + k), label=f"phase {k}")
+ax.set_xlabel("time")
+ax.legend()
+fig.savefig("output.png")
+"""
+
+
+def legacy_run(root, i):
+    """A fresh interpreter per script, as process_project used to do."""
+    job_dir = os.path.join(root, f"legacy{i}")
+    os.makedirs(job_dir)
+    with open(os.path.join(job_dir, "script.py"), "w") as f:
+        f.write(SCRIPT)
+    subprocess.run(
+        [sys.executable, "script.py"], cwd=job_dir, timeout=60, check=True,
+        env=dict(os.environ, MPLBACKEND="Agg"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generated-script execution throughput")
+    parser.add_argument("--scripts", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        for i in range(args.scripts):
+            legacy_run(tmp, i)
+        elapsed = time.perf_counter() - start
+        print(f"subprocess  {elapsed:6.2f}s  {args.scripts / elapsed:5.1f} scripts/s")
+
+        for workers in args.workers:
+            executor = CodeExecutor(workers=workers, work_dir=tmp)
+            executor.run(SCRIPT)  # start (warm) the first worker
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(
+                    lambda i: executor.run(SCRIPT, os.path.join(tmp, f"out{workers}_{i}.png")),
+                    range(args.scripts),
+                ))
+            elapsed = time.perf_counter() - start
+            executor.close()
+            failed = sum(not r.ok for r in results)
+            print(
+                f"workers={workers:<3} {elapsed:6.2f}s  {args.scripts / elapsed:5.1f} scripts/s  "
+                f"{failed} failed (includes worker start-up beyond the first)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import os
+import tempfile
+import time
+
+import fitz
+import numpy as np
+
+from extract_images import extract_images_from_pdf
+
+
+def make_pdf(path, pages, figures_per_page, seed=0):
+    """Pages with distinct figures, plus a logo and a figure repeated on every page."""
+    rng = np.random.default_rng(seed)
+
+    def png(side):
+        samples = rng.integers(0, 255, (side, side, 3), dtype=np.uint8).tobytes()
+        return fitz.Pixmap(fitz.csRGB, side, side, samples, False).tobytes("png")
+
+    logo = png(32)
+    repeated = png(300)
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(10, 10, 40, 40), stream=logo)
+        page.insert_image(fitz.Rect(50, 10, 200, 160), stream=repeated)
+        for i in range(figures_per_page):
+            y = 170 + i * 150
+            page.insert_image(fitz.Rect(50, y, 200, y + 140), stream=png(300))
+    doc.save(path)
+
+
+def legacy_extract(pdf_path, image_folder):
+    """The per-page extract_image loop that extract_images_from_pdf replaced."""
+    os.makedirs(image_folder, exist_ok=True)
+    doc = fitz.open(pdf_path)
+    written = 0
+    for page_num, page in enumerate(doc, start=1):
+        for img_index, img in enumerate(page.get_images(full=True), start=1):
+            base_image = doc.extract_image(img[0])
+            name = f"page{page_num}_img{img_index}.{base_image['ext']}"
+            with open(os.path.join(image_folder, name), "wb") as f:
+                f.write(base_image["image"])
+            written += 1
+    doc.close()
+    return written
+
+
+def folder_bytes(folder):
+    return sum(e.stat().st_size for e in os.scandir(folder))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF image extraction: writes and time")
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--figures-per-page", type=int, default=2)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "paper.pdf")
+        make_pdf(pdf_path, args.pages, args.figures_per_page)
+
+        out = os.path.join(tmp, "legacy")
+        start = time.perf_counter()
+        written = legacy_extract(pdf_path, out)
+        elapsed = time.perf_counter() - start
+        print(f"legacy     {elapsed:6.2f}s  {written:5d} images  {folder_bytes(out) >> 10:7d} KiB")
+
+        for workers in args.workers:
+            out = os.path.join(tmp, f"workers{workers}")
+            start = time.perf_counter()
+            kept = extract_images_from_pdf(pdf_path, out, out, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(
+                f"workers={workers:<3}{elapsed:6.2f}s  {len(kept):5d} images  "
+                f"{folder_bytes(out) >> 10:7d} KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
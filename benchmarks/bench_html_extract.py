@@ -0,0 +1,46 @@
+import argparse
+import time
+from pathlib import Path
+
+from html_extract import EXTRACTORS, get_extractor
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def pages_per_second(func, html, min_time):
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        func(html)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return runs / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML extractor microbenchmark on saved pages")
+    parser.add_argument("--min-time", type=float, default=1.0)
+    args = parser.parse_args()
+
+    listing = (FIXTURES / "latest.html").read_text(encoding="utf-8")
+    paper = (FIXTURES / "paper.html").read_text(encoding="utf-8")
+    reference = get_extractor("soup")
+    expected = (reference.listing_links(listing), reference.paper_links(paper))
+
+    for name in EXTRACTORS:
+        extractor = get_extractor(name)
+        if extractor.name != name:
+            continue
+        got = (extractor.listing_links(listing), extractor.paper_links(paper))
+        status = "ok" if got == expected else "MISMATCH"
+        listing_rate = pages_per_second(extractor.listing_links, listing, args.min_time)
+        paper_rate = pages_per_second(extractor.paper_links, paper, args.min_time)
+        print(
+            f"{name:<8} listing {listing_rate:8.1f} pages/s   "
+            f"paper {paper_rate:8.1f} pages/s   [{status}]"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import math
+import os
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image, ImageDraw
+
+from image_filter import prefilter
+
+GEMINI_BATCH = 4  # images per batch_check_scientific_figures_gemini call
+
+
+def _plot(path, draw, style="default", dpi=100):
+    with plt.style.context(style):
+        fig = plt.figure(figsize=(5, 4))
+        draw(fig)
+        fig.savefig(path, dpi=dpi)
+        plt.close(fig)
+
+
+def _axes(draw):
+    return lambda fig: draw(fig.add_subplot())
+
+
+def make_fixtures(root, per_kind, seed=0):
+    """Labeled images: (path, is_plot). Plots come from matplotlib, the rest
+    are the photos, diagrams and logos PDFs also contain."""
+    rng = np.random.default_rng(seed)
+    plots = {
+        "line": _axes(lambda ax: ax.plot(np.cumsum(rng.normal(size=(50, 3)), 0))),
+        "bar": _axes(lambda ax: ax.bar(range(6), rng.random(6))),
+        "scatter": _axes(lambda ax: ax.scatter(*rng.random((2, 80)))),
+        "hist": _axes(lambda ax: ax.hist(rng.normal(size=500), bins=30)),
+        "heatmap": _axes(lambda ax: ax.imshow(rng.random((20, 20)))),
+        "pie": _axes(lambda ax: ax.pie(rng.random(5))),
+        "ggplot": _axes(lambda ax: ax.plot(rng.random(20))),
+        "surface": lambda fig: fig.add_subplot(projection="3d").plot_surface(
+            *np.meshgrid(np.arange(20), np.arange(20)), rng.random((20, 20))
+        ),
+    }
+
+    def photo(i):
+        small = rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)
+        img = Image.fromarray(small).resize((640, 480), Image.BICUBIC)
+        noise = rng.normal(0, 12, (480, 640, 3))
+        return Image.fromarray(np.clip(np.asarray(img) + noise, 0, 255).astype(np.uint8))
+
+    def diagram(i):
+        img = Image.new("RGB", (600, 300), "white")
+        d = ImageDraw.Draw(img)
+        for k in range(3):
+            x = 40 + k * 190
+            d.rectangle((x, 110, x + 130, 190), outline="black", width=2)
+            d.text((x + 20, 140), f"block {k}", fill="black")
+            if k:
+                d.line((x - 60, 150, x, 150), fill="black", width=2)
+        return img
+
+    def logo(i):
+        img = Image.new("RGB", (200, 200), tuple(int(c) for c in rng.integers(0, 255, 3)))
+        d = ImageDraw.Draw(img)
+        d.ellipse((40, 40, 160, 160), fill=tuple(int(c) for c in rng.integers(0, 255, 3)))
+        return img
+
+    def texture(i):
+        x = np.linspace(0, 8 * math.pi, 400)
+        wave = np.sin(x[None, :] + rng.random() * x[:, None])
+        rgb = np.stack([wave, wave.T, -wave], axis=2) * 120 + 128
+        return Image.fromarray(rgb.astype(np.uint8))
+
+    others = {"photo": photo, "diagram": diagram, "logo": logo, "texture": texture}
+
+    fixtures = []
+    for kind, draw in plots.items():
+        style = "ggplot" if kind == "ggplot" else "default"
+        for i in range(per_kind):
+            path = os.path.join(root, f"plot_{kind}_{i}.png")
+            _plot(path, draw, style)
+            fixtures.append((path, True))
+    for kind, make in others.items():
+        for i in range(per_kind):
+            path = os.path.join(root, f"other_{kind}_{i}.jpg")
+            make(i).save(path, quality=90)
+            fixtures.append((path, False))
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-classifier savings and false negatives")
+    parser.add_argument("--per-kind", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = make_fixtures(tmp, args.per_kind)
+        paths = [path for path, _ in fixtures]
+
+        start = time.perf_counter()
+        keep = prefilter(paths)
+        elapsed = time.perf_counter() - start
+
+        plots = [k for k, (_, is_plot) in zip(keep, fixtures) if is_plot]
+        others = [k for k, (_, is_plot) in zip(keep, fixtures) if not is_plot]
+        dropped_plots = [p for k, (p, is_plot) in zip(keep, fixtures) if is_plot and not k]
+        calls_before = math.ceil(len(paths) / GEMINI_BATCH)
+        calls_after = math.ceil(sum(keep) / GEMINI_BATCH)
+
+        print(f"{len(paths)} images in {elapsed:.2f}s ({len(paths) / elapsed:.0f} images/s)")
+        print(f"non-plots dropped:   {others.count(False)}/{len(others)}")
+        print(f"false negatives:     {plots.count(False)}/{len(plots)} plots dropped")
+        for path in dropped_plots:
+            print(f"  {os.path.basename(path)}")
+        print(
+            f"API calls:           {calls_before} -> {calls_after} "
+            f"({1 - calls_after / calls_before:.0%} saved, batches of {GEMINI_BATCH})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import math
+import os
+import tempfile
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image
+
+from image_packing import (
+    image_tokens,
+    pack_batches,
+    prepare_image,
+    text_tokens,
+)
+
+LEGACY_BATCH = 4
+PROMPT = "x" * 1100  # about the length of the figure-check prompt
+
+
+def make_project(root, figures, seed=0):
+    """What extract_images leaves for one paper: high-DPI plot PNGs, vector
+    renders, a JPEG photo and a BMP."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(root, exist_ok=True)
+    paths = []
+    for i in range(figures):
+        fig, ax = plt.subplots(figsize=(6, 4.5))
+        ax.plot(np.cumsum(rng.normal(size=(200, 3)), 0))
+        path = os.path.join(root, f"page{i + 1}_img1.png")
+        fig.savefig(path, dpi=300 if i % 2 else 150)
+        plt.close(fig)
+        paths.append(path)
+    photo = rng.integers(0, 255, (1200, 1600, 3), dtype=np.uint8)
+    path = os.path.join(root, f"page{figures + 1}_img1.jpeg")
+    Image.fromarray(photo).save(path, quality=85)
+    paths.append(path)
+    path = os.path.join(root, f"page{figures + 2}_img1.bmp")
+    Image.fromarray(photo[:600, :800]).save(path)
+    paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payload bytes and requests per project")
+    parser.add_argument("--projects", type=int, default=5)
+    parser.add_argument("--figures", type=int, nargs="+", default=[2, 6, 12])
+    args = parser.parse_args()
+
+    print(f"{'images':>6}  {'legacy req':>10} {'MiB':>7} {'tokens':>7}   {'packed req':>10} {'MiB':>7} {'tokens':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for figures in args.figures:
+            totals = np.zeros(6)
+            for p in range(args.projects):
+                paths = make_project(os.path.join(tmp, f"{figures}_{p}"), figures, seed=p)
+                legacy_bytes = sum(os.path.getsize(path) for path in paths)
+                legacy_tokens = 0
+                for path in paths:
+                    with Image.open(path) as img:
+                        legacy_tokens += image_tokens(*img.size)
+                legacy_requests = math.ceil(len(paths) / LEGACY_BATCH)
+
+                images = [prepare_image(path) for path in paths]
+                batches = pack_batches(images, prompt_tokens=text_tokens(PROMPT))
+                packed_bytes = sum(len(image.data) for image in images)
+                packed_tokens = sum(image.tokens for image in images)
+                totals += [
+                    legacy_requests, legacy_bytes, legacy_tokens,
+                    len(batches), packed_bytes, packed_tokens,
+                ]
+            mean = totals / args.projects
+            print(
+                f"{figures + 2:6d}  {mean[0]:10.1f} {mean[1] / 2**20:7.2f} {mean[2]:7.0f}   "
+                f"{mean[3]:10.1f} {mean[4] / 2**20:7.2f} {mean[5]:7.0f}"
+            )
+    print(f"(per project, mean of {args.projects}; tokens are image tokens)")
+
+
+if __name__ == "__main__":
+    main()
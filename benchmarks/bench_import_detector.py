@@ -0,0 +1,80 @@
+import argparse
+import re
+import sysconfig
+import time
+from pathlib import Path
+
+from extract_code import FIGURE_LIBRARIES, check_for_plotting_libraries
+
+
+def legacy_check_for_plotting_libraries(file_content: str) -> bool:
+    """The per-call, per-pattern implementation the detector replaced."""
+    import_patterns = []
+    for lib in FIGURE_LIBRARIES:
+        patterns = [
+            rf"import\s+{lib}",
+            rf"from\s+{lib}",
+            rf"import\s+.*\s+as\s+{lib}\b",
+        ]
+        import_patterns.extend(patterns)
+    return any(
+        re.search(pattern, file_content, re.MULTILINE) for pattern in import_patterns
+    )
+
+
+def load_corpus(roots, limit):
+    corpus = []
+    for root in roots:
+        for path in sorted(Path(root).rglob("*.py")):
+            try:
+                corpus.append((path, path.read_text(encoding="utf-8", errors="ignore")))
+            except OSError:
+                continue
+            if len(corpus) >= limit:
+                return corpus
+    return corpus
+
+
+def timed(func, corpus):
+    start = time.perf_counter()
+    results = [func(content) for _, content in corpus]
+    return results, time.perf_counter() - start
+
+
+def main():
+    paths = sysconfig.get_paths()
+    parser = argparse.ArgumentParser(description="Import detector speed and agreement")
+    parser.add_argument(
+        "roots", nargs="*", default=[paths["purelib"], paths["stdlib"]],
+        help="directories of real Python sources (default: site-packages and stdlib)",
+    )
+    parser.add_argument("--limit", type=int, default=5000)
+    parser.add_argument("--show", type=int, default=10, help="disagreements to print")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.roots, args.limit)
+    megabytes = sum(len(content) for _, content in corpus) / 1e6
+    legacy, legacy_time = timed(legacy_check_for_plotting_libraries, corpus)
+    current, current_time = timed(check_for_plotting_libraries, corpus)
+
+    print(f"{len(corpus)} files, {megabytes:.1f} MB")
+    for name, results, elapsed in (
+        ("legacy", legacy, legacy_time),
+        ("current", current, current_time),
+    ):
+        print(
+            f"{name:<8} {elapsed:7.3f}s  {len(corpus) / elapsed:9.0f} files/s  "
+            f"{sum(results)} plotting files"
+        )
+    print(f"speedup  {legacy_time / current_time:.1f}x")
+
+    disagreements = [
+        (path, old, new) for (path, _), old, new in zip(corpus, legacy, current) if old != new
+    ]
+    print(f"agreement {1 - len(disagreements) / len(corpus):.4f} ({len(disagreements)} files differ)")
+    for path, old, new in disagreements[: args.show]:
+        print(f"  legacy={old!s:<5} current={new!s:<5} {path}")
+
+
+if __name__ == "__main__":
+    main()
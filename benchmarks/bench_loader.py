@@ -0,0 +1,83 @@
+import argparse
+import gzip
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from main import Format, iter_records
+
+
+def write_dump(path, records):
+    """Synthetic links-between-papers-and-code.json.gz with `records` entries."""
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("[")
+        for i in range(records):
+            if i:
+                f.write(",")
+            json.dump(
+                {
+                    "paper_url": f"https://paperswithcode.com/paper/paper-{i}",
+                    "paper_title": f"Paper number {i} about \"diffusion\" models",
+                    "paper_arxiv_id": f"2610.{i:05d}",
+                    "paper_url_abs": f"https://arxiv.org/abs/2610.{i:05d}v1",
+                    "paper_url_pdf": f"https://arxiv.org/pdf/2610.{i:05d}v1.pdf",
+                    "repo_url": f"https://github.com/owner{i % 997}/repo-{i}",
+                    "is_official": i % 3 == 0,
+                    "mentioned_in_paper": i % 2 == 0,
+                    "mentioned_in_github": False,
+                    "framework": "pytorch",
+                },
+                f,
+            )
+        f.write("]")
+
+
+def load(path):
+    """The whole-file json.load the streaming loader replaced."""
+    with gzip.open(path, mode="rb") as fp:
+        return json.loads(fp.read().decode("utf-8"))
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of the links dump loaders")
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--max-streaming-mb", type=float, default=16.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "links.json.gz")
+        write_dump(path, args.records)
+        skip = set(range(0, args.records, 2))
+
+        results = {
+            "load": measure(lambda: len(load(path))),
+            "iter_records": measure(
+                lambda: sum(1 for _ in iter_records(path, fmt=Format.json_gz))
+            ),
+            "iter_records (skip 50%)": measure(
+                lambda: sum(1 for _ in iter_records(path, fmt=Format.json_gz, skip=skip))
+            ),
+        }
+        for name, (count, elapsed, peak) in results.items():
+            print(f"{name:<24} {count:>8} records  {elapsed:6.2f}s  peak {peak / 2**20:8.1f} MiB")
+
+        streaming_peak = results["iter_records"][2] / 2**20
+        assert streaming_peak < args.max_streaming_mb, (
+            f"streaming loader peaked at {streaming_peak:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from extract_code import check_for_plotting_libraries, scan_repository
+
+PLOT_FILE = "import numpy as np\nimport matplotlib.pyplot as plt\n\n" + "plt.plot(np.arange(10))\n" * 40
+PLAIN_FILE = "import os\nimport sys\n\n" + "def f(x):\n    return x * 2\n\n" * 60
+
+
+def make_monorepo(root: Path, packages: int, files_per_package: int, seed=0) -> None:
+    """Source packages plus the clutter real repos carry: vendored deps, VCS, generated files."""
+    rng = random.Random(seed)
+    for p in range(packages):
+        for sub in ("", "utils/", "models/layers/"):
+            pkg = root / f"pkg{p}" / sub
+            pkg.mkdir(parents=True, exist_ok=True)
+            for i in range(files_per_package):
+                body = PLOT_FILE if rng.random() < 0.1 else PLAIN_FILE
+                (pkg / f"mod_{i}.py").write_text(body)
+    for vendored in (".venv/lib/python3.11/site-packages/lib", "node_modules/pkg", ".git/objects"):
+        d = root / vendored
+        d.mkdir(parents=True, exist_ok=True)
+        for i in range(files_per_package * packages):
+            (d / f"v{i}.py").write_text(PLAIN_FILE)
+    (root / "generated_pb2.py").write_text("DATA = b'" + "x" * (8 << 20) + "'\n")
+
+
+def legacy_scan(root: Path):
+    """The rglob + read_text + per-file check that scan_repository replaced."""
+    return [
+        p for p in root.rglob("*.py")
+        if check_for_plotting_libraries(p.read_text(encoding="utf-8", errors="ignore"))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repository scan throughput on a synthetic monorepo")
+    parser.add_argument("--packages", type=int, default=40)
+    parser.add_argument("--files-per-package", type=int, default=50)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_monorepo(root, args.packages, args.files_per_package)
+        total = sum(1 for _ in root.rglob("*.py"))
+
+        start = time.perf_counter()
+        found = legacy_scan(root)
+        elapsed = time.perf_counter() - start
+        print(f"legacy     {elapsed:6.2f}s  {total / elapsed:9.0f} files/s  {len(found)} plotting files")
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            found = scan_repository(root, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(
+                f"workers={workers:<3}{elapsed:6.2f}s  {total / elapsed:9.0f} files/s  "
+                f"{len(found)} plotting files"
+            )
+        print(f"({total} .py files on disk, throughput counted against all of them)")
+
+
+if __name__ == "__main__":
+    main()
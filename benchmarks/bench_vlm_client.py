@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from pydantic import BaseModel
+
+from benchmarks.fake_gemini import FakeGemini
+from vlm_client import VlmClient
+
+
+class ScientificFormat(BaseModel):
+    explanation: str
+    scientific_figures: list[int]
+
+
+def make_requests(count, images_per_request=4, image_size=64 * 1024):
+    requests = []
+    for i in range(count):
+        parts = [{"text": f"Which of these {images_per_request} images are plots? ({i})"}]
+        for j in range(images_per_request):
+            data = os.urandom(16) + bytes(image_size)
+            parts.append({"inline_data": {"mime_type": "image/png", "data": data}})
+        requests.append([{"role": "user", "parts": parts}])
+    return requests
+
+
+async def run(vlm, requests):
+    return await asyncio.gather(*(vlm.generate(r, ScientificFormat) for r in requests))
+
+
+def measure(requests, cache_path, **kwargs):
+    fake = FakeGemini(latency=kwargs.pop("latency"), error_rate=kwargs.pop("error_rate"))
+    vlm = VlmClient(fake, "fake-model", cache_path=cache_path, backoff=0.05, **kwargs)
+    start = time.perf_counter()
+    asyncio.run(run(vlm, requests))
+    elapsed = time.perf_counter() - start
+    vlm.close()
+    return elapsed, fake, vlm
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VlmClient against a local Gemini stub")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rpm", type=float, default=0)
+    args = parser.parse_args()
+
+    requests = make_requests(args.requests)
+    with tempfile.TemporaryDirectory() as tmp:
+        for concurrency in args.concurrency:
+            cache = os.path.join(tmp, f"cache{concurrency}.sqlite")
+            elapsed, fake, _ = measure(
+                requests, cache, latency=args.latency, error_rate=args.error_rate,
+                concurrency=concurrency, rpm=args.rpm, tpm=0,
+            )
+            print(
+                f"concurrency={concurrency:<3} {elapsed:6.2f}s  {args.requests / elapsed:6.1f} req/s  "
+                f"{fake.calls} calls ({fake.calls - args.requests} retried)  "
+                f"max in flight {fake.max_in_flight}"
+            )
+
+        elapsed, fake, vlm = measure(
+            requests, cache, latency=args.latency, error_rate=args.error_rate,
+            concurrency=args.concurrency[-1], rpm=args.rpm, tpm=0,
+        )
+        print(f"rerun from cache   {elapsed:6.2f}s  {fake.calls} calls, {vlm.cache_hits} cache hits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import json
+import random
+import threading
+import time
+import typing
+from types import SimpleNamespace
+
+
+class FakeApiError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeGemini:
+    """Local stand-in for genai.Client exposing `models.generate_content`.
+
+    Each call sleeps `latency` seconds, fails with a 429 with probability
+    `error_rate`, and answers with JSON filling the requested pydantic
+    schema: list[int] fields select every image sent, other lists hold one
+    placeholder per image, bools are true and strings are placeholders.
+    """
+
+    def __init__(self, latency=0.2, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.models = self
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.random.random() < self.error_rate
+        try:
+            time.sleep(self.latency)
+            if fail:
+                raise FakeApiError(429, "RESOURCE_EXHAUSTED")
+            images = sum(
+                "inline_data" in part for message in contents for part in message["parts"]
+            )
+            return SimpleNamespace(text=json.dumps(self._answer(config["response_schema"], images)))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _answer(self, schema, images):
+        answer = {}
+        for name, field in schema.model_fields.items():
+            if field.annotation is bool:
+                answer[name] = True
+            elif typing.get_origin(field.annotation) is list:
+                if typing.get_args(field.annotation) == (int,):
+                    answer[name] = list(range(images))
+                else:
+                    answer[name] = [f"stub {name} {i}" for i in range(images)]
+            else:
+                answer[name] = f"stub {name}"
+        return answer
@@ -0,0 +1,117 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+LISTING_ITEM = """
+<div class="infinite-item">
+  <h1><a href="/paper/{slug}">Paper {slug}</a></h1>
+  <a class="badge badge-dark" href="/paper/{slug}">Code</a>
+</div>
+"""
+
+PAPER_PAGE = """
+<html><body>
+<div class="paper-abstract"><p>Abstract of {slug}.</p></div>
+<a href="{base}/pdf/{slug}.pdf">Paper PDF</a>
+<a href="https://github.com/bench/{slug}">github</a>
+</body></html>
+"""
+
+
+class FakePapersWithCode:
+    """Local stand-in for paperswithcode.com with a fixed per-request latency."""
+
+    def __init__(self, papers_per_page=10, latency=0.05, pdf_size=64 * 1024):
+        self.papers_per_page = papers_per_page
+        self.latency = latency
+        self.pdf_bytes = b"%PDF-1.4\n" + b"0" * pdf_size
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def latest_url(self):
+        return f"{self.base}/latest"
+
+    def listing(self, page):
+        items = "".join(
+            LISTING_ITEM.format(slug=f"p{page}-{i}")
+            for i in range(self.papers_per_page)
+        )
+        return f"<html><body>{items}</body></html>"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                time.sleep(fake.latency)
+                parts = urlsplit(self.path)
+                if parts.path == "/latest":
+                    page = int(parse_qs(parts.query).get("page", ["1"])[0])
+                    etag = f'"latest-{page}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    self._send(fake.listing(page).encode(), "text/html", etag)
+                elif parts.path.startswith("/paper/"):
+                    slug = parts.path.rsplit("/", 1)[-1]
+                    body = PAPER_PAGE.format(slug=slug, base=fake.base)
+                    self._send(body.encode(), "text/html")
+                elif parts.path.startswith("/pdf/"):
+                    self._send_range(fake.pdf_bytes, "application/pdf")
+                else:
+                    self.send_error(404)
+
+            def _send(self, body, content_type, etag=None):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_range(self, body, content_type):
+                requested = self.headers.get("Range", "")
+                if not requested.startswith("bytes="):
+                    return self._send(body, content_type)
+                start = int(requested[len("bytes="):].split("-")[0])
+                if start >= len(body):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(body)}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Type", content_type)
+                self.send_header(
+                    "Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"
+                )
+                self.send_header("Content-Length", str(len(body) - start))
+                self.end_headers()
+                self.wfile.write(body[start:])
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,378 @@
+import argparse
+import asyncio
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+from metrics import Metrics
+
+FIXTURES = Path(__file__).parent / "fixtures"
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+RESULT_MARKER = "BENCH_RESULT "
+TOLERANCE = 0.25  # relative change flagged as a regression
+
+
+class MissingDependency(Exception):
+    pass
+
+
+@dataclass
+class Case:
+    name: str
+    unit: str  # what `items` counts
+    setup: Callable  # (tmp: Path, quick: bool) -> (run_once, items per run)
+
+
+def setup_crawl_page(tmp, quick):
+    """crawl_page on the saved listing and paper pages; no network."""
+    from crawler import CrawlEngine, crawl_page
+
+    listing = (FIXTURES / "latest.html").read_text(encoding="utf-8")
+    paper = (FIXTURES / "paper.html").read_text(encoding="utf-8")
+
+    class FixtureClient:
+        def get(self, url, **kwargs):
+            body = listing if "?page=" in url else paper
+            return SimpleNamespace(status_code=200, text=body, content=body.encode())
+
+        def remember(self, url, response):
+            pass
+
+    class StoredPdfs:
+        def fetch(self, url, name):
+            return SimpleNamespace(path=str(tmp / f"{name}.pdf"), new=False)
+
+    async def crawl():
+        engine = CrawlEngine(concurrency=8, rate=0, client=FixtureClient(), metrics=Metrics())
+        return await crawl_page(engine, 1, StoredPdfs())
+
+    def run():
+        return len(asyncio.run(crawl()))
+
+    return run, run()
+
+
+def setup_import_detection(tmp, quick):
+    from benchmarks.bench_scan import PLAIN_FILE, PLOT_FILE
+    from extract_code import check_for_plotting_libraries
+
+    contents = [PLOT_FILE if i % 10 == 0 else PLAIN_FILE for i in range(500 if quick else 5000)]
+
+    def run():
+        return sum(check_for_plotting_libraries(content) for content in contents)
+
+    return run, len(contents)
+
+
+def setup_find_python_files(tmp, quick):
+    from benchmarks.bench_scan import make_monorepo
+    from extract_code import find_python_files
+
+    make_monorepo(tmp, packages=4 if quick else 20, files_per_package=50)
+
+    def run():
+        return len(find_python_files(tmp))
+
+    return run, run()
+
+
+def setup_clone_repo(tmp, quick):
+    from benchmarks.bench_clone import make_bare_repo
+    from extract_code import clone_repo
+
+    bare = make_bare_repo(tmp, py_files=50 if quick else 200, blob_mb=2, commits=2)
+    url = bare.resolve().as_uri()
+    clones = tmp / "clones"
+
+    def run():
+        shutil.rmtree(clones, ignore_errors=True)
+        clones.mkdir()
+        clone_repo(url, clones)
+        return 1
+
+    return run, 1
+
+
+def setup_extract_images(tmp, quick):
+    from benchmarks.bench_extract_images import make_pdf
+    from extract_images import extract_images_from_pdf
+
+    pages = 10 if quick else 60
+    pdf_path = str(tmp / "paper.pdf")
+    make_pdf(pdf_path, pages, figures_per_page=2)
+    out = str(tmp / "images")
+
+    def run():
+        shutil.rmtree(out, ignore_errors=True)
+        return len(extract_images_from_pdf(pdf_path, out, out))
+
+    return run, pages
+
+
+def _import_generate_dataset_vlm():
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    try:
+        import generate_dataset_vlm
+    except ImportError as e:
+        raise MissingDependency(str(e))
+    return generate_dataset_vlm
+
+
+def setup_page_selection(tmp, quick):
+    g = _import_generate_dataset_vlm()
+    names = [
+        f"/images/page{page}_img{i}.png"
+        for page in range(100 if quick else 1000)
+        for i in range(1 + page % 15)
+    ]
+
+    def run():
+        groups = g.group_images_by_page(names)
+        return sum(len(g.select_images_from_page_group(group)) for group in groups.values())
+
+    return run, len(names)
+
+
+def setup_dataset_loop(tmp, quick):
+    """process_projects with a stubbed Gemini client and the real executor."""
+    import numpy as np
+
+    from benchmarks.bench_image_filter import _axes, _plot
+    from benchmarks.fake_gemini import FakeGemini
+    from code_executor import CodeExecutor
+    from vlm_client import VlmClient
+
+    g = _import_generate_dataset_vlm()
+    rng = np.random.default_rng(0)
+    projects = [f"project{i}" for i in range(2 if quick else 8)]
+    code_dir, image_dir = tmp / "code", tmp / "images"
+    for project in projects:
+        (code_dir / project).mkdir(parents=True)
+        (code_dir / project / "plot.py").write_text(
+            "import matplotlib.pyplot as plt\n\n"
+            "def draw(x, y):\n    plt.plot(x, y)\n    plt.xlabel('epoch')\n"
+            "    plt.savefig('loss.png')\n"
+        )
+        (image_dir / project).mkdir(parents=True)
+        for page in range(1, 5):
+            data = np.cumsum(rng.normal(size=(40, 2)), 0)
+            _plot(str(image_dir / project / f"page{page}_img1.png"), _axes(lambda ax: ax.plot(data)))
+
+    executor = CodeExecutor(workers=2, preload=())
+    atexit.register(executor.close)
+    runs = 0
+
+    def run():
+        nonlocal runs
+        runs += 1
+        # Outputs land next to the images, so every run starts from a copy.
+        output_dir = tmp / f"run{runs}"
+        shutil.copytree(image_dir, output_dir)
+        vlm = VlmClient(FakeGemini(latency=0.02), "fake", concurrency=4, rpm=0, tpm=0)
+        try:
+            asyncio.run(
+                g.process_projects(projects, str(code_dir), str(output_dir), None, vlm, executor)
+            )
+        finally:
+            vlm.close()
+            shutil.rmtree(output_dir, ignore_errors=True)
+        return len(projects)
+
+    return run, len(projects)
+
+
+CASES = {
+    case.name: case
+    for case in [
+        Case("crawl_page", "papers", setup_crawl_page),
+        Case("import_detection", "files", setup_import_detection),
+        Case("find_python_files", "files", setup_find_python_files),
+        Case("clone_repo", "repos", setup_clone_repo),
+        Case("extract_images", "pages", setup_extract_images),
+        Case("page_selection", "images", setup_page_selection),
+        Case("dataset_loop", "projects", setup_dataset_loop),
+    ]
+}
+
+
+def _peak_rss_mib(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def run_case(name, repeat, warmup, quick) -> dict:
+    """Runs in its own process, so peak RSS belongs to this case alone."""
+    case = CASES[name]
+    timings = Metrics()
+    with tempfile.TemporaryDirectory() as tmp:
+        quiet = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+                run, items = case.setup(Path(tmp), quick)
+                for _ in range(warmup):
+                    run()
+                for _ in range(repeat):
+                    with timings.timer(name):
+                        run()
+        except MissingDependency as e:
+            return {"name": name, "skipped": f"missing dependency: {e}"}
+    stats = timings.snapshot()["stages"][name]
+    return {
+        "name": name,
+        "unit": case.unit,
+        "items": items,
+        "runs": stats["count"],
+        "throughput": items * stats["count"] / stats["total"],
+        "p50": stats["p50"],
+        "p95": stats["p95"],
+        "p99": stats["p99"],
+        "peak_rss_mib": _peak_rss_mib(resource.RUSAGE_SELF) if resource else None,
+        "children_peak_rss_mib": (
+            _peak_rss_mib(resource.RUSAGE_CHILDREN) if resource else None
+        ),
+    }
+
+
+def spawn_case(name, repeat, warmup, quick) -> dict:
+    command = [sys.executable, "-m", "benchmarks.run", "--child", name]
+    command += ["--repeat", str(repeat), "--warmup", str(warmup)]
+    if quick:
+        command.append("--quick")
+    root = Path(__file__).resolve().parent.parent
+    proc = subprocess.run(command, cwd=root, capture_output=True, text=True)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    error = proc.stderr.strip().splitlines()
+    return {"name": name, "error": error[-1] if error else f"exit code {proc.returncode}"}
+
+
+def machine() -> dict:
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(result, base, tolerance) -> list:
+    """Regressions of `result` against its baseline entry, as messages."""
+    regressions = []
+    if result["throughput"] < base["throughput"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {result['throughput']:.1f} < {base['throughput']:.1f} {result['unit']}/s"
+        )
+    # p50 rather than the tail: with a handful of runs p95 is just the slowest.
+    if result["p50"] > base["p50"] * (1 + tolerance):
+        regressions.append(f"p50 {result['p50']:.3f}s > {base['p50']:.3f}s")
+    if result["peak_rss_mib"] and base.get("peak_rss_mib"):
+        if result["peak_rss_mib"] > base["peak_rss_mib"] * (1 + tolerance):
+            regressions.append(
+                f"peak RSS {result['peak_rss_mib']:.0f} > {base['peak_rss_mib']:.0f} MiB"
+            )
+    return regressions
+
+
+def _change(value, base):
+    return f"{(value / base - 1) * 100:+6.1f}%" if base else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks of every pipeline stage, compared to a baseline"
+    )
+    parser.add_argument("cases", nargs="*", help=f"any of {', '.join(CASES)} (default all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="smaller fixtures")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store these results as the baseline"
+    )
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    if args.child:
+        result = run_case(args.child, args.repeat, args.warmup, args.quick)
+        print(RESULT_MARKER + json.dumps(result))
+        return
+
+    baseline = {}
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("machine") != machine():
+            print(f"Note: baseline was recorded on {baseline.get('machine')}")
+        if baseline.get("quick", False) != args.quick:
+            # Throughput and latency on other fixture sizes are not comparable.
+            print("Baseline was recorded with different fixture sizes (--quick); not comparing")
+            baseline = {}
+
+    results = []
+    failed = False
+    print(
+        f"{'case':<18}{'throughput':>16}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}"
+        f"{'RSS MiB':>9}{'vs base':>9}"
+    )
+    for name in args.cases or CASES:
+        result = spawn_case(name, args.repeat, args.warmup, args.quick)
+        results.append(result)
+        if "skipped" in result or "error" in result:
+            failed |= "error" in result
+            print(f"{name:<18}{result.get('skipped') or 'ERROR: ' + result['error']}")
+            continue
+        base = baseline.get("cases", {}).get(name)
+        if base and base["items"] != result["items"]:
+            print(f"{name}: baseline ran {base['items']} {base['unit']} per run; not comparing")
+            base = None
+        rate = f"{result['throughput']:.1f} {result['unit']}/s"
+        rss = result["peak_rss_mib"]
+        print(
+            f"{name:<18}{rate:>16}{result['p50']:>9.3f}{result['p95']:>9.3f}"
+            f"{result['p99']:>9.3f}{rss or 0:>9.0f}"
+            f"{_change(result['throughput'], base['throughput']) if base else '':>9}"
+        )
+        for regression in compare(result, base, args.tolerance) if base else ():
+            failed = True
+            print(f"  REGRESSION: {regression}")
+
+    report = {
+        "machine": machine(),
+        "quick": args.quick,
+        "recorded": time.strftime("%Y-%m-%d"),
+        "cases": {r["name"]: r for r in results if "throughput" in r},
+    }
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline saved to {args.baseline}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
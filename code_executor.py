@@ -0,0 +1,342 @@
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from metrics import default_metrics
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, no fork
+    resource = None
+
+TIMEOUT = 30  # wall-clock seconds per script
+CPU_SECONDS = 30
+MEMORY_BYTES = 4 << 30  # address space; numpy and matplotlib map a lot up front
+OUTPUT_NAME = "output.png"
+MAX_LOG_BYTES = 64 << 10  # tail of stdout/stderr kept in the result
+PRELOAD_MODULES = (
+    "numpy",
+    "pandas",
+    "matplotlib.pyplot",
+    "seaborn",
+    "plotly",
+    "bokeh",
+    "altair",
+)
+WORKER_ENV = {
+    "MPLBACKEND": "Agg",
+    "OPENBLAS_NUM_THREADS": "1",
+    "OMP_NUM_THREADS": "1",
+    "MKL_NUM_THREADS": "1",
+    "PYTHONDONTWRITEBYTECODE": "1",
+}
+
+
+@dataclass
+class ExecutionResult:
+    status: str  # "ok", "error", "timeout" or "killed"
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    image_path: Optional[str]  # where output.png ended up, if it was written
+    wall_time: float
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+
+def _tail(path):
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - MAX_LOG_BYTES))
+            return f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return ""
+
+
+def _child(job):
+    """Runs in the forked child: never returns."""
+    import runpy
+    import traceback
+
+    code = 1
+    try:
+        os.setsid()  # own process group, so a timeout kills grandchildren too
+        os.chdir(job["dir"])
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        for fd, name in ((1, "stdout.txt"), (2, "stderr.txt")):
+            out = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.dup2(out, fd)
+        if job["cpu_seconds"]:
+            cpu = job["cpu_seconds"]
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        if job["memory_bytes"]:
+            memory = job["memory_bytes"]
+            resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        sys.argv = [job["script"]]
+        sys.path[0] = job["dir"]
+        runpy.run_path(job["script"], run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _run_forked(job):
+    import signal
+
+    start = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        _child(job)
+    deadline = start + job["timeout"]
+    timed_out = False
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            break
+        if time.monotonic() > deadline:
+            timed_out = True
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, status = os.waitpid(pid, 0)
+            break
+        time.sleep(0.005)
+    if timed_out:
+        result, returncode = "timeout", None
+    elif os.WIFSIGNALED(status):
+        # SIGXCPU/SIGKILL from the CPU rlimit, SIGSEGV, ...
+        result, returncode = "killed", -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+        result = "ok" if returncode == 0 else "error"
+    return {
+        "status": result,
+        "returncode": returncode,
+        "wall_time": time.monotonic() - start,
+    }
+
+
+def serve(preload):
+    """Worker loop: import the plotting stack once, then fork one child per
+    job read from stdin and answer on stdout, one JSON object per line."""
+    import contextlib
+    import importlib
+
+    # stdout is the reply channel; nothing printed on import may land there.
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in preload:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+    print(json.dumps({"ready": True}), flush=True)
+    for line in sys.stdin:
+        print(json.dumps(_run_forked(json.loads(line))), flush=True)
+
+
+class _Worker:
+    def __init__(self, preload):
+        env = dict(os.environ, **WORKER_ENV)
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", *preload],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            text=True,
+        )
+        if not self.proc.stdout.readline():
+            raise RuntimeError("executor worker failed to start")
+
+    def run(self, job):
+        try:
+            self.proc.stdin.write(json.dumps(job) + "\n")
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        except (OSError, ValueError):  # ValueError: pipe closed by close()
+            line = ""
+        if not line:
+            raise RuntimeError("executor worker died")
+        return json.loads(line)
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+class CodeExecutor:
+    """Runs generated plotting scripts in isolated, resource-limited processes.
+
+    On POSIX, `workers` long-lived interpreters import the plotting stack
+    once (Agg backend) and fork a fresh child per script, so runs start
+    warm but share no state. Each run gets its own temp directory, CPU and
+    address-space rlimits and a wall-clock timeout. Without fork (Windows)
+    each script gets a plain subprocess instead. `run` is thread-safe; up
+    to `workers` scripts execute at once.
+    """
+
+    def __init__(
+        self,
+        workers=4,
+        timeout=TIMEOUT,
+        cpu_seconds=CPU_SECONDS,
+        memory_bytes=MEMORY_BYTES,
+        preload=PRELOAD_MODULES,
+        work_dir=None,
+        metrics=None,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.preload = preload
+        self.work_dir = work_dir
+        self.metrics = metrics or default_metrics()
+        self.forking = hasattr(os, "fork") and resource is not None
+        self._idle = queue.Queue()
+        self._slots = threading.Semaphore(workers)
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _acquire_worker(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            worker = _Worker(self.preload)
+            with self._lock:
+                self._workers.append(worker)
+            return worker
+
+    def _discard(self, worker):
+        worker.close()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+
+    def _execute(self, job):
+        if not self.forking:
+            start = time.monotonic()
+            with open(os.path.join(job["dir"], "stdout.txt"), "wb") as out, open(
+                os.path.join(job["dir"], "stderr.txt"), "wb"
+            ) as err:
+                try:
+                    proc = subprocess.run(
+                        [sys.executable, job["script"]],
+                        cwd=job["dir"],
+                        stdout=out,
+                        stderr=err,
+                        stdin=subprocess.DEVNULL,
+                        env=dict(os.environ, **WORKER_ENV),
+                        timeout=self.timeout,
+                    )
+                except subprocess.TimeoutExpired:
+                    return {"status": "timeout", "returncode": None,
+                            "wall_time": time.monotonic() - start}
+            return {
+                "status": "ok" if proc.returncode == 0 else "error",
+                "returncode": proc.returncode,
+                "wall_time": time.monotonic() - start,
+            }
+
+        worker = self._acquire_worker()
+        try:
+            result = worker.run(job)
+        except RuntimeError:
+            # A crashed worker is replaced, and the job is tried once more.
+            self._discard(worker)
+            worker = self._acquire_worker()
+            try:
+                result = worker.run(job)
+            except RuntimeError:
+                self._discard(worker)
+                raise
+        with self._lock:
+            # Workers finishing after close() are not handed out again.
+            closed = worker not in self._workers
+        if closed:
+            worker.close()
+        else:
+            self._idle.put(worker)
+        return result
+
+    def run(self, code, output_path=None, script_name="script.py") -> ExecutionResult:
+        """Run `code` and move the OUTPUT_NAME it writes to `output_path`.
+
+        Without `output_path` the image is left in the job directory, which
+        is then kept; otherwise the directory is removed.
+        """
+        job_dir = tempfile.mkdtemp(prefix="replicate-", dir=self.work_dir)
+        script = os.path.join(job_dir, script_name)
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(code)
+        job = {
+            "dir": job_dir,
+            "script": script,
+            "timeout": self.timeout,
+            "cpu_seconds": self.cpu_seconds,
+            "memory_bytes": self.memory_bytes,
+        }
+        with self._slots:
+            outcome = self._execute(job)
+
+        image_path = os.path.join(job_dir, OUTPUT_NAME)
+        if not os.path.exists(image_path):
+            image_path = None
+        elif output_path:
+            shutil.move(image_path, output_path)
+            image_path = output_path
+        result = ExecutionResult(
+            outcome["status"],
+            outcome["returncode"],
+            _tail(os.path.join(job_dir, "stdout.txt")),
+            _tail(os.path.join(job_dir, "stderr.txt")),
+            image_path,
+            outcome["wall_time"],
+        )
+        if output_path or not image_path:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        self.metrics.observe("execute", result.wall_time)
+        self.metrics.outcome(
+            "execute", "success" if result.ok else "failed", "" if result.ok else result.status
+        )
+        return result
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for worker in workers:
+            worker.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        serve(sys.argv[2:])
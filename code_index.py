@@ -0,0 +1,263 @@
+import ast
+import glob
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List
+
+from extract_code import FIGURE_LIBRARIES
+
+CHARS_PER_TOKEN = 4
+CODE_TOKEN_BUDGET = 6000
+MAX_CHUNKS = 8
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Method names that draw or style a figure, whatever object they are called on.
+PLOT_METHODS = frozenset(
+    """plot bar barh scatter hist hist2d imshow pcolormesh contour contourf
+    errorbar fill_between boxplot violinplot pie stem step stackplot quiver
+    heatmap lineplot scatterplot barplot countplot histplot kdeplot boxplot
+    violinplot pairplot relplot catplot displot lmplot regplot jointplot
+    subplots figure savefig set_xlabel set_ylabel set_title xlabel ylabel
+    title legend colorbar suptitle grid""".split()
+)
+
+# Words a figure description uses, mapped to the API names that draw it.
+QUERY_SYNONYMS = {
+    "line": "plot lineplot",
+    "curve": "plot lineplot",
+    "bar": "bar barh barplot countplot",
+    "histogram": "hist histplot displot",
+    "distribution": "hist histplot kdeplot displot",
+    "density": "kdeplot",
+    "scatter": "scatter scatterplot",
+    "heatmap": "heatmap imshow pcolormesh",
+    "matrix": "heatmap imshow",
+    "box": "boxplot",
+    "violin": "violinplot",
+    "pie": "pie",
+    "contour": "contour contourf",
+    "error": "errorbar fill_between",
+    "shaded": "fill_between",
+}
+
+_WORD_RE = re.compile(r"[A-Za-z][a-z]*|[A-Z]+(?![a-z])|\d+")
+
+
+def tokenize(text) -> List[str]:
+    """Lower-cased words, splitting snake_case and camelCase identifiers."""
+    return [word.lower() for word in _WORD_RE.findall(text)]
+
+
+def estimate_tokens(text) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class Chunk:
+    file: str
+    start: int  # 1-based first line
+    end: int  # last line, inclusive
+    text: str
+    plot_calls: Counter
+    terms: Counter = field(default_factory=Counter)
+    tokens: int = 0
+
+
+def _library_aliases(tree):
+    aliases = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] in FIGURE_LIBRARIES:
+                    aliases.add((alias.asname or alias.name).split(".")[0])
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            if node.module.split(".")[0] in FIGURE_LIBRARIES:
+                aliases.update(alias.asname or alias.name for alias in node.names)
+    return aliases
+
+
+def _call_root(func):
+    while isinstance(func, ast.Attribute):
+        func = func.value
+    return func.id if isinstance(func, ast.Name) else None
+
+
+def _plot_calls(node, aliases) -> Counter:
+    calls = Counter()
+    for call in ast.walk(node):
+        if not isinstance(call, ast.Call):
+            continue
+        func = call.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", "")
+        if name in PLOT_METHODS or _call_root(func) in aliases:
+            calls[name] += 1
+    return calls
+
+
+def chunk_source(path, source) -> List[Chunk]:
+    """Functions and runs of module-level statements that contain plotting calls.
+
+    Files that do not parse become a single chunk.
+    """
+    lines = source.splitlines()
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return [Chunk(path, 1, len(lines), source, Counter())]
+
+    aliases = _library_aliases(tree)
+    spans = []
+    run = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+        if isinstance(node, ast.ClassDef):
+            if run:
+                spans.append(run)
+                run = []
+            spans.extend(
+                [item]
+                for item in node.body
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+            )
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if run:
+                spans.append(run)
+                run = []
+            spans.append([node])
+        else:
+            run.append(node)
+    if run:
+        spans.append(run)
+
+    chunks = []
+    for nodes in spans:
+        calls = Counter()
+        for node in nodes:
+            calls.update(_plot_calls(node, aliases))
+        if not calls:
+            continue
+        start = min(
+            n.decorator_list[0].lineno if getattr(n, "decorator_list", None) else n.lineno
+            for n in nodes
+        )
+        end = max(n.end_lineno for n in nodes)
+        chunks.append(
+            Chunk(path, start, end, "\n".join(lines[start - 1 : end]), calls)
+        )
+    return chunks
+
+
+def _imports(source):
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return ""
+    lines = source.splitlines()
+    return "\n".join(
+        "\n".join(lines[node.lineno - 1 : node.end_lineno])
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+class CodeIndex:
+    """BM25 index over the plotting chunks of one project's snippets.
+
+    Built once per project; `context` then picks the chunks most relevant
+    to a figure description under a token budget.
+    """
+
+    def __init__(self, chunks: List[Chunk], imports=None):
+        self.chunks = chunks
+        self.imports = imports or {}
+        for chunk in chunks:
+            chunk.terms = Counter(tokenize(chunk.text))
+            # Plotting calls count again, so the chart type weighs more than
+            # variable names.
+            chunk.terms.update(chunk.plot_calls)
+            chunk.tokens = estimate_tokens(chunk.text)
+        self.avg_length = (
+            sum(sum(c.terms.values()) for c in chunks) / len(chunks) if chunks else 0
+        )
+        document_frequency = Counter()
+        for chunk in chunks:
+            document_frequency.update(chunk.terms.keys())
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    @classmethod
+    def from_folder(cls, folder):
+        chunks = []
+        imports = {}
+        for path in sorted(glob.glob(os.path.join(folder, "*.py"))):
+            with open(path, "r", encoding="utf-8") as f:
+                source = f.read()
+            file_chunks = chunk_source(path, source)
+            if file_chunks:
+                chunks.extend(file_chunks)
+                imports[path] = _imports(source)
+        return cls(chunks, imports)
+
+    def query_terms(self, query):
+        terms = tokenize(query)
+        for word in list(terms):
+            terms.extend(QUERY_SYNONYMS.get(word.rstrip("s"), "").split())
+        return terms
+
+    def scores(self, query) -> List[float]:
+        terms = self.query_terms(query)
+        scores = []
+        for chunk in self.chunks:
+            length = sum(chunk.terms.values())
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self.avg_length or 1))
+            score = 0.0
+            for term in terms:
+                tf = chunk.terms.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query, k=MAX_CHUNKS) -> List[Chunk]:
+        """Top `k` chunks; ties (e.g. an empty query) go to the most plotting."""
+        ranked = sorted(
+            zip(self.scores(query), self.chunks),
+            key=lambda pair: (-pair[0], -sum(pair[1].plot_calls.values())),
+        )
+        return [chunk for _, chunk in ranked[:k]]
+
+    def context(self, query, token_budget=CODE_TOKEN_BUDGET, k=MAX_CHUNKS) -> str:
+        """Best chunks for `query` that fit the budget, grouped by file in
+        source order, each file headed by its imports."""
+        selected = []
+        used = 0
+        for chunk in self.search(query, k):
+            header = 0 if any(c.file == chunk.file for c in selected) else (
+                estimate_tokens(self.imports.get(chunk.file, "")) + 10
+            )
+            if selected and used + header + chunk.tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used += header + chunk.tokens
+
+        parts = []
+        for path in dict.fromkeys(c.file for c in selected):
+            file_chunks = sorted((c for c in selected if c.file == path), key=lambda c: c.start)
+            body = "\n\n".join(
+                f"# lines {c.start}-{c.end}\n{c.text}" for c in file_chunks
+            )
+            imports = self.imports.get(path, "")
+            parts.append(
+                f"# File: {os.path.basename(path)}\n"
+                + (f"{imports}\n\n" if imports else "")
+                + body
+            )
+        return "\n\n".join(parts)
@@ -0,0 +1,163 @@
+import csv
+import os
+import sqlite3
+import time
+
+RESULT_FIELDS = ["github_url", "pdf_url", "local_pdf_path"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    num_pages INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    run_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    papers INTEGER NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (run_id, page)
+);
+CREATE TABLE IF NOT EXISTS papers (
+    paper_url TEXT PRIMARY KEY,
+    github_url TEXT,
+    pdf_url TEXT,
+    local_pdf_path TEXT,
+    run_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    crawled_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS papers_github_url ON papers (github_url);
+"""
+
+
+class CrawlState:
+    """Crash-safe crawl progress in SQLite (WAL): runs, finished pages, papers.
+
+    A run that did not reach `finish_run` is resumed by the next
+    `start_run`, skipping the pages it had already completed.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def start_run(self, num_pages) -> int:
+        row = self.conn.execute(
+            "SELECT id, num_pages FROM runs WHERE finished_at IS NULL "
+            "ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if row:
+            run_id, previous = row
+            if num_pages != previous:
+                self.conn.execute(
+                    "UPDATE runs SET num_pages = ? WHERE id = ?", (num_pages, run_id)
+                )
+            return run_id
+        cur = self.conn.execute(
+            "INSERT INTO runs (num_pages, started_at) VALUES (?, ?)",
+            (num_pages, time.time()),
+        )
+        return cur.lastrowid
+
+    def completed_pages(self, run_id) -> set:
+        rows = self.conn.execute("SELECT page FROM pages WHERE run_id = ?", (run_id,))
+        return {page for (page,) in rows}
+
+    def record_paper(self, run_id, page, result):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO papers (paper_url, github_url, pdf_url, "
+            "local_pdf_path, run_id, page, crawled_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                result["paper_url"],
+                result["github_url"],
+                result["pdf_url"],
+                result["local_pdf_path"],
+                run_id,
+                page,
+                time.time(),
+            ),
+        )
+
+    def known_paper_urls(self) -> set:
+        rows = self.conn.execute("SELECT paper_url FROM papers")
+        return {paper_url for (paper_url,) in rows}
+
+    def complete_page(self, run_id, page, num_papers):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (run_id, page, papers, completed_at) "
+            "VALUES (?, ?, ?, ?)",
+            (run_id, page, num_papers, time.time()),
+        )
+
+    def finish_run(self, run_id):
+        self.conn.execute(
+            "UPDATE runs SET finished_at = ? WHERE id = ?", (time.time(), run_id)
+        )
+
+    def close(self):
+        self.conn.close()
+
+
+class ResultsCsv:
+    """Append-only results CSV; dedupe keys are read once at open."""
+
+    def __init__(self, path, fields=RESULT_FIELDS, key="github_url"):
+        self.path = path
+        self.fields = fields
+        self.key = key
+        self.keys = set()
+        self.rows = 0
+        if os.path.exists(path):
+            self._repair_tail()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    self.rows += 1
+                    if row.get(key):
+                        self.keys.add(row[key])
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=fields).writeheader()
+
+    def _repair_tail(self):
+        # Drop a half-written last line left behind by a crash.
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step)
+                newline = chunk.rfind(b"\n")
+                if newline != -1:
+                    f.truncate(pos + newline + 1)
+                    return
+            f.truncate(0)
+
+    def append(self, rows):
+        """Append the rows whose key has not been written yet; returns them."""
+        new_rows = []
+        for row in rows:
+            if row[self.key] and row[self.key] not in self.keys:
+                self.keys.add(row[self.key])
+                new_rows.append(row)
+        if not new_rows:
+            return new_rows
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=self.fields, extrasaction="ignore")
+            writer.writerows(new_rows)
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows += len(new_rows)
+        return new_rows
@@ -1,94 +1,276 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
 from tqdm import tqdm
-import pandas as pd
 import os
-import time
+from urllib.parse import urljoin
 
-def crawl_page(page, pdf_dir):
-    base_url = "https://paperswithcode.com/latest"
+from crawl_state import CrawlState, ResultsCsv
+from downloader import PdfDownloader, pdf_name
+from html_extract import get_extractor
+from http_client import default_client
+from metrics import default_metrics
+from rate_limit import HostRateLimiter
+
+BASE_URL = "https://paperswithcode.com/latest"
+
+
+class CrawlEngine:
+    """Bounded worker pool for blocking HTTP calls, rate limited per host."""
+
+    def __init__(
+        self, concurrency=8, rate=2.0, burst=4, client=None, extractor=None, metrics=None
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = HostRateLimiter(rate, burst)
+        self.client = client or default_client()
+        self.extractor = extractor or get_extractor()
+        self.metrics = metrics or default_metrics()
+
+    async def run(self, url, func, *args, **kwargs):
+        await self.limiter.acquire(url)
+        async with self.semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    def _timed_get(self, url, **kwargs):
+        with self.metrics.timer("http"):
+            response = self.client.get(url, **kwargs)
+        if not kwargs.get("stream"):
+            self.metrics.add_bytes("http", len(response.content))
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.run(url, self._timed_get, url, **kwargs)
+
+
+def listing_url(base_url, page):
+    return f"{base_url}?page={page}"
+
+
+async def crawl_paper(engine, page_url, downloader):
+    local_pdf_path = None
+
+    page_resp = await engine.get(page_url)
+    if page_resp.status_code != 200:
+        print(f"Failed to fetch paper page {page_url}: {page_resp.status_code}")
+        engine.metrics.outcome("paper", "failed", f"http {page_resp.status_code}")
+        return None
+    github_url, pdf_url = engine.extractor.paper_links(page_resp.text)
+
+    try:
+        download_link = pdf_url
+        if not download_link:
+            raise ValueError(f"no PDF link on {page_url}")
+        download = await engine.run(
+            download_link, downloader.fetch, download_link, pdf_name(github_url)
+        )
+        local_pdf_path = download.path
+        engine.metrics.outcome("pdf", "success" if download.new else "skipped")
+    except Exception as e:
+        print(f"Failed to download PDF: {e}")
+        engine.metrics.outcome(
+            "pdf", "failed", "no link" if not download_link else "other"
+        )
+
+    engine.metrics.outcome("paper", "success")
+    return {
+        "paper_url": page_url,
+        "github_url": github_url,
+        "pdf_url": pdf_url,
+        "local_pdf_path": local_pdf_path,
+    }
+
+
+async def crawl_page(
+    engine,
+    page,
+    downloader,
+    base_url=BASE_URL,
+    on_paper=None,
+    on_listing=None,
+    known=None,
+    on_response=None,
+):
+    """Crawl one listing page and the papers on it.
+
+    `on_listing` receives the page's paper links in listing order (None if
+    the page is unchanged since the last crawl); papers whose link is in
+    `known` are not fetched again. The listing's validators are remembered
+    once all of its papers are done, or handed to `on_response` with the
+    listing response so the caller can remember them after storing the
+    results.
+    """
     results = []
 
-    url = f"{base_url}?page={page}"
-    response = requests.get(url)
+    url = listing_url(base_url, page)
+    response = await engine.get(url, conditional=True, remember=False)
+    if response.status_code == 304:
+        print(f"Page {page} not modified since last crawl, skipping")
+        engine.metrics.outcome("listing", "skipped", "not modified")
+        if on_listing:
+            on_listing(None)
+        return results
     if response.status_code != 200:
-        print(f"Failed to fetch page {page}")
-        print(response.content)
+        print(f"Failed to fetch page {page}: {response.status_code}")
+        engine.metrics.outcome("listing", "failed", f"http {response.status_code}")
         return results
     print(url)
-    soup = BeautifulSoup(response.text, "html.parser")
-    papers = soup.find_all("div", class_="infinite-item")
-    os.makedirs(pdf_dir, exist_ok=True)
-    for paper in tqdm(papers, total=len(papers)):
-        time.sleep(2)
-        page_link = paper.find("a", class_="badge badge-dark")
-        github_url = None
-        pdf_url = None
-        local_pdf_path = None
-
-        # Get GitHub repo URL
-        if page_link:
-            page_url = page_link.get("href", "")
-            if page_url.startswith("/"):
-                page_url = "https://paperswithcode.com" + page_url
-            page_resp = requests.get(page_url)
-            if page_resp.status_code == 200:
-                page_soup = BeautifulSoup(page_resp.text, "html.parser")
-                github_a = page_soup.find("a", href=lambda x: x and "github.com" in x)
-                if github_a:
-                    github_url = github_a["href"].strip()
+    engine.metrics.outcome("listing", "success")
+    paper_urls = [
+        urljoin(base_url, href) for href in engine.extractor.listing_links(response.text)
+    ]
+    if on_listing:
+        on_listing(paper_urls)
+
+    tasks = [
+        asyncio.ensure_future(crawl_paper(engine, page_url, downloader))
+        for page_url in paper_urls
+        if not (known and page_url in known)
+    ]
+    if len(tasks) < len(paper_urls):
+        engine.metrics.outcome("paper", "skipped", "known", len(paper_urls) - len(tasks))
+
+    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+        result = await task
+        if result and on_paper:
+            on_paper(result)
+    for task in tasks:
+        result = task.result()
+        if result and (result["github_url"] or result["pdf_url"]):
+            results.append(result)
+    if on_response:
+        on_response(response)
+    else:
+        engine.client.remember(url, response)
+    return results
+
+
+async def _crawl(
+    num_pages,
+    results_csv,
+    downloader,
+    engine,
+    base_url,
+    state,
+    stop_after_known,
+    page_window,
+):
+    run_id = state.start_run(num_pages)
+    done = state.completed_pages(run_id)
+    if done:
+        print(f"Resuming crawl run {run_id}, {len(done)} pages already completed")
+
+    # In delta mode known papers are not fetched again, and pagination stops
+    # after `stop_after_known` consecutive known papers in listing order.
+    known = state.known_paper_urls() if stop_after_known else None
+    listings = {}
+    responses = {}
+    tasks = {}
+
+    def schedule(page):
+        tasks[page] = asyncio.ensure_future(
+            crawl_page(
+                engine,
+                page,
+                downloader,
+                base_url,
+                on_paper=lambda result: state.record_paper(run_id, page, result),
+                on_listing=lambda urls: listings.__setitem__(page, urls),
+                known=known,
+                on_response=lambda response: responses.__setitem__(page, response),
+            )
+        )
+
+    # Pages are scheduled `ahead` at a time (all of them outside delta mode)
+    # so listing, paper and PDF requests overlap; results are still merged
+    # in page order.
+    pages = [page for page in range(1, num_pages + 1) if page not in done]
+    ahead = page_window if stop_after_known else len(pages)
+    for page in pages[:ahead]:
+        schedule(page)
+
+    streak = 0
+    finished = set()
+    try:
+        for i, page in enumerate(pages):
+            results = await tasks[page]
+            page_results = results_csv.append(results)
+            state.complete_page(run_id, page, len(results))
+            # Only a stored page may come back as a 304 on the next crawl.
+            if page in responses:
+                engine.client.remember(listing_url(base_url, page), responses.pop(page))
+            finished.add(page)
+            if i + ahead < len(pages):
+                schedule(pages[i + ahead])
+
+            if page_results:
+                print(f"Saved {len(page_results)} new results to {results_csv.path}")
             else:
-                print(page_resp.content)
+                print(f"No new results found on page {page}")
+
+            if not stop_after_known or page not in listings:
                 continue
-            
-            try:
-                download_a = page_soup.find("a", href=lambda x: x and ".pdf" in x)
-                download_link = download_a["href"].strip()
-                pdf_url = download_link
-                pdf_response = requests.get(download_link, stream=True)
-                pdf_filename = os.path.join(pdf_dir, github_url.split("/")[-1] + ".pdf")
-                with open(pdf_filename, "wb") as f:
-                    for chunk in pdf_response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                local_pdf_path = pdf_filename
-            except Exception as e:
-                print(f"Failed to download PDF: {e}")
-
-        if github_url or pdf_url:
-            results.append({
-                "github_url": github_url,
-                "pdf_url": pdf_url,
-                "local_pdf_path": local_pdf_path
-            })
-    return results
+            if listings[page] is None:
+                streak = stop_after_known
+            for paper_url in listings[page] or ():
+                streak = streak + 1 if paper_url in known else 0
+            if streak >= stop_after_known:
+                print(f"Reached {streak} already known papers on page {page}, stopping")
+                break
+    finally:
+        # An unfinished page must be fetched in full on resume, not as a 304.
+        for page, task in tasks.items():
+            if page not in finished:
+                task.cancel()
+                engine.client.forget(listing_url(base_url, page))
+
+    state.finish_run(run_id)
+    print(f"Final results saved to {results_csv.path}, total entries: {results_csv.rows}")
 
-def crawl_paperswithcode(num_pages, output_csv, pdf_dir):
+
+def crawl_paperswithcode(
+    num_pages,
+    output_csv,
+    pdf_dir,
+    concurrency=8,
+    rate=2.0,
+    base_url=BASE_URL,
+    client=None,
+    state_db=None,
+    stop_after_known=None,
+    page_window=2,
+    parser=None,
+):
+    if state_db is None:
+        state_db = os.path.splitext(output_csv)[0] + "_state.sqlite"
+    engine = CrawlEngine(
+        concurrency=concurrency,
+        rate=rate,
+        client=client,
+        extractor=get_extractor(parser),
+    )
+    state = CrawlState(state_db)
     try:
-        df = pd.read_csv(output_csv)
-        existing_urls = set(df['github_url'].dropna())
-    except FileNotFoundError:
-        df = pd.DataFrame(columns=['github_url', 'pdf_url', 'local_pdf_path'])
-        existing_urls = set()
-
-    for page in range(1, num_pages + 1):
-        page_results = []
-        results = crawl_page(page, pdf_dir=pdf_dir)
-        
-        for result in results:
-            if result['github_url'] and result['github_url'] not in existing_urls:
-                page_results.append(result)
-                existing_urls.add(result['github_url'])
-        
-        if page_results:
-            new_df = pd.DataFrame(page_results)
-            df = pd.concat([df, new_df], ignore_index=True)
-            df.to_csv(output_csv, index=False)
-            print(f"Saved {len(page_results)} new results to {output_csv}")
-        else:
-            print(f"No new results found on page {page}")
-
-    print(f"Final results saved to {output_csv}, total entries: {len(df)}")
+        asyncio.run(
+            _crawl(
+                num_pages,
+                ResultsCsv(output_csv),
+                PdfDownloader(pdf_dir, client=engine.client, metrics=engine.metrics),
+                engine,
+                base_url,
+                state,
+                stop_after_known,
+                page_window,
+            )
+        )
+    finally:
+        engine.client.save()
+        state.close()
+        print(engine.metrics.summary())
+
 
 if __name__ == "__main__":
-    crawl_paperswithcode(num_pages=30, output_csv="crawled_links.csv", pdf_dir="./PDFs")
\ No newline at end of file
+    crawl_paperswithcode(
+        num_pages=30,
+        output_csv="crawled_links.csv",
+        pdf_dir="./PDFs",
+        stop_after_known=20,
+    )
@@ -0,0 +1,454 @@
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Optional
+
+from metrics import default_metrics
+from similarity import INDEX_FILE as SIMILARITY_INDEX_FILE, SimilarityIndex
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for --format parquet
+    pa = pq = None
+
+EXPORT_FORMATS = ("webdataset", "parquet")
+SHARD_EXTENSIONS = {"webdataset": ".tar", "parquet": ".parquet"}
+SHARD_PREFIX = "plots"
+SHARD_MAX_SAMPLES = 1000
+SHARD_MAX_BYTES = 512 << 20
+ROW_GROUP_SAMPLES = 64  # parquet rows buffered before they are written
+EXPORT_WORKERS = 4
+INDEX_FILE = "export_index.sqlite"
+META_SUFFIX = "_meta.json"  # written next to each sample by process_project
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    name TEXT PRIMARY KEY,
+    number INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    key TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    shard TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    exported_at REAL NOT NULL
+);
+"""
+
+_KEY_UNSAFE = re.compile(r"[^A-Za-z0-9_\-]")
+
+
+def _key_part(name):
+    """`name` made key-safe; escaped names get a short hash of the original
+    so that e.g. "p.a" and "p_a" stay apart."""
+    safe = _KEY_UNSAFE.sub("_", name)
+    if safe == name:
+        return name
+    return f"{safe}-{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+
+
+@dataclass
+class SampleFiles:
+    project: str
+    base: str  # e.g. page3_img1
+    code: str
+    original: str
+    replicated: Optional[str]
+    meta: Optional[str]
+
+    @property
+    def key(self) -> str:
+        """WebDataset key: the part of a member name before the first dot."""
+        return f"{_key_part(self.project)}/{_key_part(self.base)}"
+
+    def paths(self):
+        return [p for p in (self.code, self.original, self.replicated, self.meta) if p]
+
+    def size(self) -> int:
+        return sum(os.path.getsize(p) for p in self.paths())
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha1()
+        for path in self.paths():
+            stat = os.stat(path)
+            digest.update(f"{os.path.basename(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        return digest.hexdigest()
+
+
+def find_samples(output_dir, require_replicated=True) -> List[SampleFiles]:
+    """Every generated script under `output_dir` with its original figure."""
+    samples = []
+    pattern = os.path.join(output_dir, "*", "*_generated.py")
+    for code in sorted(glob.glob(pattern)):
+        base = code[: -len("_generated.py")]
+        originals = sorted(glob.glob(glob.escape(base) + "_original.*"))
+        replicated = base + "_replicated.png"
+        meta = base + META_SUFFIX
+        if not originals:
+            continue
+        if not os.path.exists(replicated):
+            if require_replicated:
+                continue
+            replicated = None
+        samples.append(
+            SampleFiles(
+                os.path.basename(os.path.dirname(code)),
+                os.path.basename(base),
+                code,
+                originals[0],
+                replicated,
+                meta if os.path.exists(meta) else None,
+            )
+        )
+    return samples
+
+
+def _read(path, mode="rb"):
+    encoding = None if "b" in mode else "utf-8"
+    with open(path, mode, encoding=encoding) as f:
+        return f.read()
+
+
+def load_sample(files: SampleFiles, provenance=None) -> dict:
+    """One sample's bytes, code, descriptions and provenance, read from disk."""
+    meta = json.loads(_read(files.meta, "r")) if files.meta else {}
+    return {
+        "key": files.key,
+        "project": files.project,
+        "original": _read(files.original),
+        "original_ext": os.path.splitext(files.original)[1].lstrip(".").lower(),
+        "replicated": _read(files.replicated) if files.replicated else None,
+        "code": _read(files.code, "r"),
+        "description": meta.get("code_description", ""),
+        "figure_description": meta.get("figure_description", ""),
+        "provenance": {
+            "project": files.project,
+            "figure": files.base,
+            "source_image": meta.get("source_image"),
+            "execution_status": meta.get("execution_status"),
+            **(provenance or {}),
+        },
+    }
+
+
+class TarShardWriter:
+    """WebDataset shard: per sample `<key>.original.<ext>`, `<key>.replicated.png`,
+    `<key>.py` and `<key>.json`."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp = path + ".tmp"
+        self.tar = tarfile.open(self.tmp, "w", format=tarfile.PAX_FORMAT)
+        self.mtime = time.time()
+
+    def _add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def write(self, sample):
+        key = sample["key"]
+        self._add(f"{key}.original.{sample['original_ext']}", sample["original"])
+        if sample["replicated"] is not None:
+            self._add(f"{key}.replicated.png", sample["replicated"])
+        self._add(f"{key}.py", sample["code"].encode("utf-8"))
+        info = {
+            name: sample[name]
+            for name in ("key", "project", "description", "figure_description", "provenance")
+        }
+        self._add(f"{key}.json", json.dumps(info, ensure_ascii=False).encode("utf-8"))
+
+    def close(self):
+        self.tar.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        self.tar.close()
+        os.remove(self.tmp)
+
+
+class ParquetShardWriter:
+    """Parquet shard, one row per sample, written ROW_GROUP_SAMPLES rows at a time."""
+
+    def __init__(self, path):
+        if pq is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.path = path
+        self.tmp = path + ".tmp"
+        self.schema = pa.schema(
+            [
+                ("key", pa.string()),
+                ("project", pa.string()),
+                ("original", pa.binary()),
+                ("original_ext", pa.string()),
+                ("replicated", pa.binary()),
+                ("code", pa.string()),
+                ("description", pa.string()),
+                ("figure_description", pa.string()),
+                ("provenance", pa.string()),  # JSON
+            ]
+        )
+        self.writer = pq.ParquetWriter(self.tmp, self.schema)
+        self.rows = []
+
+    def _flush(self):
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def write(self, sample):
+        row = dict(sample)
+        row["provenance"] = json.dumps(sample["provenance"], ensure_ascii=False)
+        self.rows.append(row)
+        if len(self.rows) >= ROW_GROUP_SAMPLES:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        self.writer.close()
+        os.remove(self.tmp)
+
+
+WRITERS = {"webdataset": TarShardWriter, "parquet": ParquetShardWriter}
+
+
+def plan_shards(samples, max_samples=SHARD_MAX_SAMPLES, max_bytes=SHARD_MAX_BYTES):
+    """Split samples, in order, by count and on-disk size; a sample larger
+    than `max_bytes` gets a shard of its own."""
+    shards = []
+    shard, size = [], 0
+    for sample in samples:
+        sample_size = sample.size()
+        if shard and (len(shard) >= max_samples or size + sample_size > max_bytes):
+            shards.append(shard)
+            shard, size = [], 0
+        shard.append(sample)
+        size += sample_size
+    if shard:
+        shards.append(shard)
+    return shards
+
+
+def build_shard(path, fmt, samples, provenance=None) -> int:
+    """Stream `samples` into a new shard at `path`; returns its size in bytes.
+
+    The shard is written under a temporary name and renamed when complete,
+    so a crash never leaves a truncated shard behind.
+    """
+    writer = WRITERS[fmt](path)
+    try:
+        for files in samples:
+            writer.write(load_sample(files, (provenance or {}).get(files.key)))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return os.path.getsize(path)
+
+
+class ExportIndex:
+    """Which sample went into which shard, in SQLite next to the shards."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def exported(self) -> dict:
+        """key -> fingerprint of every exported sample."""
+        return dict(self.conn.execute("SELECT key, fingerprint FROM samples").fetchall())
+
+    def next_number(self) -> int:
+        (number,) = self.conn.execute("SELECT MAX(number) FROM shards").fetchone()
+        return 0 if number is None else number + 1
+
+    def record(self, name, number, fmt, samples, size):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO shards VALUES (?, ?, ?, ?, ?, ?)",
+                (name, number, fmt, len(samples), size, now),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?)",
+                [(s.key, s.project, name, s.fingerprint(), now) for s in samples],
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def _provenance(samples, output_dir, manifest_path):
+    """Repo and paper URLs from the manifest, similarity scores from the
+    similarity index, when those exist."""
+    repos = {}
+    if manifest_path and os.path.exists(manifest_path):
+        from manifest import ManifestStore
+
+        manifest = ManifestStore(manifest_path)
+        repos = manifest.repos()
+        manifest.close()
+    scores = {}
+    similarity_path = os.path.join(output_dir, SIMILARITY_INDEX_FILE)
+    if os.path.exists(similarity_path):
+        index = SimilarityIndex(similarity_path)
+        scores = {
+            (project, os.path.basename(replicated)): score
+            for project, _, replicated, score in index.passing(float("-inf"))
+        }
+        index.close()
+
+    provenance = {}
+    for files in samples:
+        repo_url, paper_url = repos.get(files.project, (None, None))
+        provenance[files.key] = {
+            "repo_url": repo_url,
+            "paper_url_pdf": paper_url,
+            "similarity": scores.get(
+                (files.project, os.path.basename(files.replicated or ""))
+            ),
+        }
+    return provenance
+
+
+def export_dataset(
+    output_dir,
+    export_dir,
+    fmt="webdataset",
+    manifest_path=None,
+    workers=EXPORT_WORKERS,
+    max_samples=SHARD_MAX_SAMPLES,
+    max_bytes=SHARD_MAX_BYTES,
+    min_score=None,
+    require_replicated=True,
+) -> dict:
+    """Pack the samples under `output_dir` not exported yet into new shards.
+
+    Existing shards are never rewritten: a rerun only appends shards for new
+    samples. Samples whose files changed after export keep their old copy
+    and are counted as `changed`; export to a fresh directory to rebuild.
+    Shards are built in parallel, each streamed one sample at a time.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == "parquet" and pq is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    metrics = default_metrics()
+    os.makedirs(export_dir, exist_ok=True)
+    index = ExportIndex(os.path.join(export_dir, INDEX_FILE))
+    try:
+        exported = index.exported()
+        samples = find_samples(output_dir, require_replicated)
+        changed = sum(
+            1
+            for s in samples
+            if s.key in exported and exported[s.key] != s.fingerprint()
+        )
+        new = [s for s in samples if s.key not in exported]
+        provenance = _provenance(new, output_dir, manifest_path)
+        if min_score is not None:
+            new = [
+                s
+                for s in new
+                if provenance[s.key]["similarity"] is not None
+                and provenance[s.key]["similarity"] >= min_score
+            ]
+
+        shards = plan_shards(new, max_samples, max_bytes)
+        first = index.next_number()
+        written = 0
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for number, shard in enumerate(shards, start=first):
+                name = f"{SHARD_PREFIX}-{number:06d}{SHARD_EXTENSIONS[fmt]}"
+                path = os.path.join(export_dir, name)
+                future = pool.submit(build_shard, path, fmt, shard, provenance)
+                futures[future] = (name, number, shard)
+            for future in as_completed(futures):
+                name, number, shard = futures[future]
+                try:
+                    size = future.result()
+                except Exception as e:
+                    # Finished shards are still recorded; these samples go
+                    # into a new shard on the next run.
+                    errors.append(e)
+                    continue
+                index.record(name, number, fmt, shard, size)
+                metrics.add_bytes("export", size)
+                metrics.incr("export_samples", len(shard))
+                written += len(shard)
+        if errors:
+            raise errors[0]
+        return {
+            "found": len(samples),
+            "exported": written,
+            "skipped": len(samples) - len(new) - changed,
+            "changed": changed,
+            "shards": len(shards),
+        }
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack replicated figures, code and descriptions into dataset shards"
+    )
+    parser.add_argument("output_dir", nargs="?", default="./matched_outputs")
+    parser.add_argument("export_dir", nargs="?", default="./data/export")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="webdataset")
+    parser.add_argument("--manifest", default="./manifest.sqlite")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    parser.add_argument("--shard-samples", type=int, default=SHARD_MAX_SAMPLES)
+    parser.add_argument("--shard-mb", type=int, default=SHARD_MAX_BYTES >> 20)
+    parser.add_argument(
+        "--min-score", type=float, default=None, help="only pairs scoring at least this"
+    )
+    parser.add_argument(
+        "--include-failed",
+        action="store_true",
+        help="also export samples whose generated code produced no image",
+    )
+    args = parser.parse_args()
+
+    summary = export_dataset(
+        args.output_dir,
+        args.export_dir,
+        args.format,
+        manifest_path=args.manifest,
+        workers=args.workers,
+        max_samples=args.shard_samples,
+        max_bytes=args.shard_mb << 20,
+        min_score=args.min_score,
+        require_replicated=not args.include_failed,
+    )
+    print(
+        f"Exported {summary['exported']} of {summary['found']} samples into "
+        f"{summary['shards']} new shards ({summary['skipped']} already exported, "
+        f"{summary['changed']} changed since export)"
+    )
+
+
+if __name__ == "__main__":
+    main()
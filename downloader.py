@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from dataclasses import dataclass
+
+from http_client import default_client
+from metrics import default_metrics
+
+CHUNK_SIZE = 1 << 20  # 1 MiB reads from the socket
+BUFFER_SIZE = 4 << 20  # 4 MiB file write buffer
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    path: str  # <pdf_dir>/<name>.pdf, a hard link to the stored object
+    sha256: str
+    size: int
+    new: bool  # False when the content was already in the store
+
+
+def pdf_name(github_url: str) -> str:
+    """File stem for a repo's PDF; keeps the owner so forks don't collide."""
+    parts = github_url.rstrip("/").split("/")
+    return "__".join(parts[-2:]) if len(parts) >= 2 else parts[-1]
+
+
+def _content_range(response):
+    """(first byte, total length) from a Content-Range header; None if unknown."""
+    m = re.match(
+        r"bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)",
+        response.headers.get("Content-Range", ""),
+    )
+    if not m:
+        return None, None
+    start, total = m.groups()
+    return (
+        int(start) if start is not None else None,
+        int(total) if total != "*" else None,
+    )
+
+
+def _save_validator(path, response):
+    # Weak ETags are not allowed in If-Range.
+    etag = response.headers.get("ETag")
+    validator = etag if etag and not etag.startswith("W/") else None
+    validator = validator or response.headers.get("Last-Modified")
+    if validator:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(validator)
+    else:
+        _remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class PdfDownloader:
+    """Thread-safe, resumable downloads into a content-addressed store.
+
+    Objects live at `<store_dir>/<sha256>.pdf`; `<pdf_dir>/<name>.pdf` is a
+    hard link (or copy) to the object, so identical papers linked from
+    several repos are stored once and reported with `new=False`.
+    """
+
+    def __init__(self, pdf_dir, store_dir=None, client=None, metrics=None):
+        self.pdf_dir = str(pdf_dir)
+        self.store_dir = store_dir or os.path.join(self.pdf_dir, ".objects")
+        self.tmp_dir = os.path.join(self.store_dir, "partial")
+        self.index_file = os.path.join(self.store_dir, "index.json")
+        self.client = client or default_client()
+        self.metrics = metrics or default_metrics()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self.index = {"urls": {}, "names": {}}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    def object_path(self, sha256):
+        return os.path.join(self.store_dir, f"{sha256}.pdf")
+
+    def _save_index(self):
+        tmp = self.index_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_file)
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def _link(self, sha256, name):
+        path = os.path.join(self.pdf_dir, name + ".pdf")
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(self.object_path(sha256), tmp)
+        except OSError:
+            shutil.copyfile(self.object_path(sha256), tmp)
+        os.replace(tmp, path)
+        return path
+
+    def _hash_file(self, path, digest):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(block)
+
+    def _transfer(self, url, key=None):
+        """Download `url` into a partial file, resuming it with a Range request.
+
+        A partial file is only resumed with the ETag or Last-Modified it was
+        started with, sent as If-Range, and only if the server's Content-Range
+        starts where the file ends; otherwise it is downloaded from scratch.
+        Returns the partial file path and the SHA-256 of its full content.
+        """
+        part = os.path.join(
+            self.tmp_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part"
+        )
+        validator_file = part + ".validator"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        validator = None
+        if offset and os.path.exists(validator_file):
+            with open(validator_file, "r", encoding="utf-8") as f:
+                validator = f.read().strip()
+        if not validator:
+            offset = 0
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+        digest = hashlib.sha256()
+        response = self.client.get(url, stream=True, headers=headers)
+        with response:
+            start, total = _content_range(response)
+            if offset and response.status_code == 416:
+                if total == offset:
+                    # The partial file already holds the whole body.
+                    self._hash_file(part, digest)
+                    _remove(validator_file)
+                    return part, digest.hexdigest()
+                restart = True
+            elif offset and response.status_code == 206 and start != offset:
+                restart = True
+            else:
+                restart = False
+                response.raise_for_status()
+                if response.status_code == 206:
+                    self._hash_file(part, digest)
+                else:
+                    # Full body: the server ignored the Range header or the
+                    # resource changed since the partial file was started.
+                    offset = 0
+                    _save_validator(validator_file, response)
+                received = 0
+                with open(part, "ab" if offset else "wb", buffering=BUFFER_SIZE) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            digest.update(chunk)
+                            f.write(chunk)
+                            received += len(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.metrics.add_bytes("download", received, key=key)
+        if restart:
+            _remove(part)
+            _remove(validator_file)
+            return self._transfer(url, key)
+        _remove(validator_file)
+        return part, digest.hexdigest()
+
+    def _cached(self, url, name):
+        with self._lock:
+            sha256 = self.index["names"].get(name) or self.index["urls"].get(url)
+        path = os.path.join(self.pdf_dir, name + ".pdf")
+        if not sha256 and os.path.exists(path):
+            # A file from before the store existed: adopt it instead of
+            # downloading it again.
+            digest = hashlib.sha256()
+            self._hash_file(path, digest)
+            sha256 = digest.hexdigest()
+            if not os.path.exists(self.object_path(sha256)):
+                try:
+                    os.link(path, self.object_path(sha256))
+                except OSError:
+                    shutil.copyfile(path, self.object_path(sha256))
+        if not sha256 or not os.path.exists(self.object_path(sha256)):
+            return None
+        if not os.path.exists(path):
+            path = self._link(sha256, name)
+        with self._lock:
+            if self.index["names"].get(name) != sha256:
+                self.index["urls"].setdefault(url, sha256)
+                self.index["names"][name] = sha256
+                self._save_index()
+        return DownloadResult(
+            url, path, sha256, os.path.getsize(self.object_path(sha256)), False
+        )
+
+    def fetch(self, url, name, key=None) -> DownloadResult:
+        """Download `url` as `<pdf_dir>/<name>.pdf` unless its content is stored.
+
+        Bytes received are counted under `key` (e.g. the repo) in metrics.
+        """
+        cached = self._cached(url, name)
+        if cached:
+            return cached
+
+        with self._url_lock(url):
+            cached = self._cached(url, name)
+            if cached:
+                return cached
+            part, sha256 = self._transfer(url, key)
+            size = os.path.getsize(part)
+            new = not os.path.exists(self.object_path(sha256))
+            if new:
+                os.replace(part, self.object_path(sha256))
+            else:
+                os.remove(part)
+
+            path = self._link(sha256, name)
+            with self._lock:
+                self.index["urls"][url] = sha256
+                self.index["names"][name] = sha256
+                self._save_index()
+        return DownloadResult(url, path, sha256, size, new)
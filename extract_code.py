@@ -1,14 +1,74 @@
+import mmap
 import os
 import re
-from pathlib import Path
+import shutil
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
 from git import Repo
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 import pandas as pd
 from tqdm import tqdm
 
+from http_client import default_client
+from metrics import default_metrics
+from scan_cache import ScanCache, file_record, outputs_present, remote_head
+
 
 FIGURE_LIBRARIES = ["matplotlib", "seaborn", "plotly", "bokeh", "altair", "ggplot"]
 
+# Part of the scan cache key; bump when detection rules change so cached
+# results are recomputed.
+DETECTOR_VERSION = 2
+
+_LIBRARY_NAMES = "|".join(FIGURE_LIBRARIES)
+# One pass over the file for every library: `from lib ...`, `import lib`
+# (also inside a comma-separated list) and `import x as lib`, at the start
+# of a line so indented imports in functions and try blocks still count.
+_PLOT_IMPORT_RE = re.compile(
+    rf"^[ \t]*(?:"
+    rf"from[ \t]+(?P<from_lib>{_LIBRARY_NAMES})\b"
+    rf"|import[ \t]+(?:[\w.]+(?:[ \t]+as[ \t]+\w+)?[ \t]*,[ \t]*)*"
+    rf"(?P<import_lib>{_LIBRARY_NAMES})\b"
+    rf"|import[ \t][\w. \t,]*?[ \t]as[ \t]+(?P<alias_lib>{_LIBRARY_NAMES})\b"
+    rf")",
+    re.MULTILINE,
+)
+_PLOT_IMPORT_BYTES_RE = re.compile(_PLOT_IMPORT_RE.pattern.encode(), re.MULTILINE)
+_LIBRARY_BYTES = [lib.encode() for lib in FIGURE_LIBRARIES]
+
+# Directories never worth scanning: VCS metadata, vendored dependencies and
+# build output.
+IGNORE_DIRS = frozenset(
+    {
+        ".git",
+        ".hg",
+        ".svn",
+        "__pycache__",
+        "site-packages",
+        "node_modules",
+        ".venv",
+        "venv",
+        ".tox",
+        ".eggs",
+        "build",
+        "dist",
+    }
+)
+MAX_FILE_BYTES = 2 << 20  # larger .py files are generated code or data
+SCAN_PREFIX_BYTES = 256 << 10  # import detection only looks this far
+SCAN_WORKERS = 8
+SCAN_BATCH = 64  # files per thread-pool task
+MMAP_MIN_BYTES = 64 << 10  # smaller files are cheaper to read() than to map
+
+# "full": complete clone; "sparse": depth-1, blob-filtered clone with a
+# sparse checkout of *.py only; "tarball": stream the GitHub archive and
+# write only the .py members.
+CLONE_MODES = ("full", "sparse", "tarball")
+CLONE_MODE = "sparse"
+TMP_MAX_BYTES = 10 << 30  # cloned working trees kept around for re-scans
+
 
 # class CodeStructure(BaseModel):
 #     produces_plot: bool
@@ -16,7 +76,33 @@ FIGURE_LIBRARIES = ["matplotlib", "seaborn", "plotly", "bokeh", "altair", "ggplo
 #     description: str
 
 
-def clone_repo(url: Path, dest: Path) -> Path:
+def archive_url(url: str) -> str:
+    return url.rstrip("/").removesuffix(".git") + "/archive/HEAD.tar.gz"
+
+
+def extract_python_members(fileobj, dest: Path) -> int:
+    """Write the .py files of a streamed tar.gz archive under `dest`.
+
+    The archive's top-level directory is stripped; returns the number of
+    files written.
+    """
+    count = 0
+    with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+        for member in tar:
+            if not member.isfile() or not member.name.endswith(".py"):
+                continue
+            parts = PurePosixPath(member.name).parts[1:]
+            if not parts or ".." in parts:
+                continue
+            target = dest.joinpath(*parts)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with tar.extractfile(member) as src, open(target, "wb") as out:
+                out.write(src.read())
+            count += 1
+    return count
+
+
+def clone_repo(url: Path, dest: Path, mode: str = CLONE_MODE) -> Path:
     repo_name = url.rstrip("/").split("/")[-1]
     clone_path = dest / repo_name
 
@@ -24,58 +110,184 @@ def clone_repo(url: Path, dest: Path) -> Path:
         print(f"Repository already exists {repo_name}, skipping clone.")
         return clone_path
     print(f"cloning repo: {repo_name}")
-    Repo.clone_from(url, clone_path)
+    if mode == "full":
+        Repo.clone_from(url, clone_path)
+    elif mode == "sparse":
+        repo = Repo.clone_from(
+            url, clone_path, depth=1, filter="blob:none", sparse=True
+        )
+        repo.git.sparse_checkout("set", "--no-cone", "*.py")
+    elif mode == "tarball":
+        response = default_client().get(archive_url(url), stream=True)
+        with response:
+            response.raise_for_status()
+            response.raw.decode_content = False
+            # Extracted next to clone_path and renamed into place, so a
+            # failed download never leaves a partial tree behind.
+            dest.mkdir(parents=True, exist_ok=True)
+            partial = Path(tempfile.mkdtemp(prefix=f".{repo_name}-", dir=dest))
+            try:
+                extract_python_members(response.raw, partial)
+                partial.rename(clone_path)
+            except BaseException:
+                shutil.rmtree(partial, ignore_errors=True)
+                raise
+    else:
+        raise ValueError(f"Unknown clone mode: {mode}")
     return clone_path
 
 
+def iter_python_files(
+    root, ignore_dirs=IGNORE_DIRS, max_bytes=MAX_FILE_BYTES
+) -> Iterator[Path]:
+    """Walk `root` with os.scandir, pruning `ignore_dirs` and oversized files."""
+    stack = [os.fspath(root)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in ignore_dirs:
+                            stack.append(entry.path)
+                    elif entry.name.endswith(".py") and entry.is_file():
+                        if max_bytes and entry.stat().st_size > max_bytes:
+                            continue
+                        yield Path(entry.path)
+                except OSError:
+                    continue
+
+
 def find_python_files(root: str) -> List[Path]:
     """Find all Python files in the repository."""
-    return list(root.rglob("*.py"))
+    return list(iter_python_files(root))
+
+
+def detect_plotting_library(file_content: str) -> Optional[str]:
+    """Return the first plotting library imported in the file, if any."""
+    # Plain substring scans are far cheaper than the regex and rule out
+    # most files.
+    if not any(lib in file_content for lib in FIGURE_LIBRARIES):
+        return None
+    m = _PLOT_IMPORT_RE.search(file_content)
+    return m.group(m.lastgroup) if m else None
 
 
 def check_for_plotting_libraries(file_content: str) -> bool:
     """Check if any plotting libraries are imported in the file."""
-    import_patterns = []
-    for lib in FIGURE_LIBRARIES:
-        patterns = [
-            rf"import\s+{lib}",
-            rf"from\s+{lib}",
-            rf"import\s+.*\s+as\s+{lib}\b",
-        ]
-        import_patterns.extend(patterns)
-    return any(
-        re.search(pattern, file_content, re.MULTILINE) for pattern in import_patterns
-    )
-
-
-def process_repository(url: str, temp_dir: Path, output_dir: str) -> None:
-    repo_path = clone_repo(url, temp_dir)
-    py_files = find_python_files(repo_path)
-    for py_file in py_files:
-        try:
-            content = py_file.read_text(encoding="utf-8", errors="ignore")
-            if not check_for_plotting_libraries(content):
+    return detect_plotting_library(file_content) is not None
+
+
+def detect_plotting_library_in_file(
+    path, prefix_bytes=SCAN_PREFIX_BYTES
+) -> Optional[str]:
+    """detect_plotting_library on the first `prefix_bytes` of a file.
+
+    Small files are read as bytes; larger ones are memory-mapped and
+    searched in place. Neither is decoded into a string.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return None
+        end = min(size, prefix_bytes) if prefix_bytes else size
+        if end <= MMAP_MIN_BYTES:
+            return _detect_in_buffer(f.read(end), end)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _detect_in_buffer(mm, end)
+
+
+def _detect_in_buffer(buf, end) -> Optional[str]:
+    if not any(buf.find(lib, 0, end) != -1 for lib in _LIBRARY_BYTES):
+        return None
+    m = _PLOT_IMPORT_BYTES_RE.search(buf, 0, end)
+    return m.group(m.lastgroup).decode() if m else None
+
+
+def scan_repository(
+    root,
+    workers=SCAN_WORKERS,
+    ignore_dirs=IGNORE_DIRS,
+    max_bytes=MAX_FILE_BYTES,
+    prefix_bytes=SCAN_PREFIX_BYTES,
+) -> List[Tuple[Path, str]]:
+    """(path, library) for every Python file under `root` importing a plotting library."""
+
+    def scan(paths):
+        found = []
+        for path in paths:
+            try:
+                lib = detect_plotting_library_in_file(path, prefix_bytes)
+            except OSError as e:
+                print(f"Error processing {path}: {e}")
                 continue
+            if lib:
+                found.append((path, lib))
+        return found
 
+    def batches(paths, size=SCAN_BATCH):
+        batch = []
+        for path in paths:
+            batch.append(path)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    files = iter_python_files(root, ignore_dirs, max_bytes)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [hit for found in pool.map(scan, batches(files)) for hit in found]
+
+
+def process_repository(
+    url: str, temp_dir: Path, output_dir: str, cache: ScanCache = None
+) -> None:
+    repo_name = url.rstrip("/").split("/")[-1]
+    head_sha = remote_head(url) if cache else None
+    if head_sha:
+        cached = cache.get(url, head_sha)
+        if cached is not None and outputs_present(cached, f"{output_dir}/{repo_name}"):
+            print(f"Repository {repo_name} unchanged since last scan, skipping.")
+            return
+        clone_path = temp_dir / repo_name
+        if clone_path.exists() and cache.tree_sha(clone_path) != head_sha:
+            cache.remove_tree(clone_path)
+
+    repo_path = clone_repo(url, temp_dir)
+    files = []
+    for py_file, library in scan_repository(repo_path):
+        try:
             os.makedirs(f"{output_dir}/{repo_path.name}", exist_ok=True)
-            orig_code_output_file = (
-                f"{output_dir}/{repo_path.name}/{py_file.stem}_code_orig.py"
-            )
+            output = f"{py_file.stem}_code_orig.py"
+            orig_code_output_file = f"{output_dir}/{repo_path.name}/{output}"
+            content = py_file.read_text(encoding="utf-8", errors="ignore")
 
             with open(orig_code_output_file, "w", encoding="utf8") as f:
                 f.write(content)
+            files.append(file_record(repo_path, py_file, output, content, library))
 
             print(f"  ↳ Extracted plot code to {orig_code_output_file}")
 
         except Exception as e:
             print(f"Error processing {py_file}: {e}")
 
+    if head_sha:
+        cache.put(url, head_sha, files)
+        cache.touch_tree(repo_path, url, head_sha)
+
 
 def main():
     file_addr = "crawled_links.csv"
     temp_dir = Path("./tmp")
     output_dir = "./gather_data"
     os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(temp_dir, exist_ok=True)
+    cache = ScanCache(temp_dir / "scan_cache.sqlite", DETECTOR_VERSION)
+    metrics = default_metrics()
 
     # try:
     df = pd.read_csv(file_addr, usecols=["github_url", "local_pdf_path"])
@@ -83,11 +295,14 @@ def main():
     for index, row in tqdm(df.iterrows(), total=df.shape[0]):
         url = row["github_url"]
         title = row["local_pdf_path"]
-        process_repository(url, temp_dir, output_dir)
+        with metrics.timer("repository", key=url):
+            process_repository(url, temp_dir, output_dir, cache)
+        cache.evict_trees(TMP_MAX_BYTES)
         # print(f"url: {url} done")
 
     # finally:
     #     shutil.rmtree(temp_dir)
+    print(metrics.summary())
 
 
 if __name__ == "__main__":
@@ -1,36 +1,321 @@
+import hashlib
+import json
 import os
+import re
 import shutil
 import stat
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import groupby
 
 import fitz
 
+MIN_IMAGE_SIDE = 64  # px; smaller images are icons, bullets and logos
+MAX_ASPECT_RATIO = 20  # thinner images are rules and separators
+PAGES_PER_TASK = 16
+PARALLEL_MIN_PAGES = 32
+
+# "raster" extracts embedded images, "vector" renders figures drawn as
+# vector paths (most matplotlib output), "both" does both.
+IMAGE_MODES = ("raster", "vector", "both")
+IMAGE_MODE = "both"
+VECTOR_DPI = 150
+# Bump when find_figure_regions changes, so cached renders are redone.
+FIGURE_VERSION = 1
+
+FIGURE_GAP = 12  # pt; drawings closer than this belong to the same figure
+LABEL_MARGIN = 24  # pt around the drawings searched for tick and axis labels
+CAPTION_DISTANCE = 36  # pt between a figure and its caption
+FIGURE_MIN_SIDE = 72  # pt
+FIGURE_MIN_PATHS = 20  # drawings needed when no caption is adjacent
+
+_FIGURE_CAPTION_RE = re.compile(r"^\s*(?:fig\.?|figure)\s*\d+", re.IGNORECASE)
+_TABLE_CAPTION_RE = re.compile(r"^\s*table\s*\d+", re.IGNORECASE)
+
 
 def on_rm_error(func, path, exc_info):
     os.chmod(path, stat.S_IWRITE)
     func(path)
 
 
-def extract_images_from_pdf(pdf_path, image_folder, code_folder):
-    os.makedirs(image_folder, exist_ok=True)
-    doc = fitz.open(pdf_path)
-    flag = False
-    for page_num, page in enumerate(doc, start=1):
-        images = page.get_images(full=True)
+def _keep_image(width, height, bpc):
+    if min(width, height) < MIN_IMAGE_SIDE:
+        return False
+    if max(width, height) > MAX_ASPECT_RATIO * min(width, height):
+        return False
+    # 1-bit images are masks and scanned line art, never rendered plots.
+    return bpc > 1
+
+
+def plan_images(doc):
+    """(page_num, img_index, xref) of the first use of every image worth extracting.
+
+    Only the image metadata from the page resources is read; nothing is
+    decoded here.
+    """
+    seen = set()
+    plan = []
+    for page_num in range(1, doc.page_count + 1):
+        images = doc.get_page_images(page_num - 1, full=True)
         for img_index, img in enumerate(images, start=1):
-            xref = img[0]
+            xref, _, width, height, bpc = img[:5]
+            if xref in seen:
+                continue
+            seen.add(xref)
+            if _keep_image(width, height, bpc):
+                plan.append((page_num, img_index, xref))
+    return plan
+
+
+def _extract(pdf_path, image_folder, items):
+    """Decode and write `items`; returns (filename, sha256) of each written image."""
+    written = []
+    hashes = set()
+    with fitz.open(pdf_path) as doc:
+        for page_num, img_index, xref in items:
             base_image = doc.extract_image(xref)
+            if not base_image:
+                continue
             image_bytes = base_image["image"]
-            image_ext = base_image["ext"]
-            image_filename = f"page{page_num}_img{img_index}.{image_ext}"
-            image_path = os.path.join(image_folder, image_filename)
-            with open(image_path, "wb") as img_file:
+            sha256 = hashlib.sha256(image_bytes).hexdigest()
+            if sha256 in hashes:
+                continue
+            hashes.add(sha256)
+            image_filename = f"page{page_num}_img{img_index}.{base_image['ext']}"
+            with open(os.path.join(image_folder, image_filename), "wb") as img_file:
                 img_file.write(image_bytes)
-            flag = True
-    doc.close()
-    if not flag:
+            written.append((image_filename, sha256))
+    return written
+
+
+def _run_in_chunks(func, items, page_of, page_count, workers):
+    """func(items) over page ranges in a process pool for long PDFs, else inline."""
+    if workers > 1 and page_count >= PARALLEL_MIN_PAGES and len(items) > 1:
+        chunks = [
+            list(chunk)
+            for _, chunk in groupby(
+                items, key=lambda item: (page_of(item) - 1) // PAGES_PER_TASK
+            )
+        ]
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            return [w for chunk in pool.map(func, chunks) for w in chunk]
+    return func(items)
+
+
+def _merge_rects(rects, gap):
+    """Group rectangles lying within `gap` of each other; returns [rect, count] pairs."""
+    clusters = []
+    for rect in rects:
+        clusters.append([fitz.Rect(rect), 1])
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for rect, count in clusters:
+            grown = rect + (-gap, -gap, gap, gap)
+            for cluster in out:
+                if cluster[0].intersects(grown):
+                    cluster[0] |= rect
+                    cluster[1] += count
+                    merged = True
+                    break
+            else:
+                out.append([rect, count])
+        clusters = out
+    return clusters
+
+
+def _caption_near(region, captions):
+    for block in captions:
+        overlaps = block.x0 < region.x1 and block.x1 > region.x0
+        below = 0 <= block.y0 - region.y1 <= CAPTION_DISTANCE
+        above = 0 <= region.y0 - block.y1 <= CAPTION_DISTANCE
+        if overlaps and (below or above):
+            return True
+    return False
+
+
+def find_figure_regions(page):
+    """Clip rectangles of the vector figures on a page.
+
+    Only pages with a "Figure N" caption are analysed. Drawings are grouped
+    by proximity, grown to take in the text labels around them, and kept
+    when a figure caption is adjacent or they hold enough paths; drawings
+    next to a table caption or under an embedded image are skipped.
+    """
+    blocks = [b for b in page.get_text("blocks") if b[6] == 0]
+    figure_captions = [
+        fitz.Rect(b[:4]) for b in blocks if _FIGURE_CAPTION_RE.match(b[4])
+    ]
+    if not figure_captions:
+        return []
+    table_captions = [
+        fitz.Rect(b[:4]) for b in blocks if _TABLE_CAPTION_RE.match(b[4])
+    ]
+    caption_rects = figure_captions + table_captions
+
+    page_area = abs(page.rect)
+    rects = []
+    for drawing in page.get_drawings():
+        rect = drawing["rect"] + (-0.5, -0.5, 0.5, 0.5)
+        if abs(rect) < 0.9 * page_area:  # skip page backgrounds and frames
+            rects.append(rect)
+    image_rects = [fitz.Rect(info["bbox"]) for info in page.get_image_info()]
+
+    regions = []
+    for region, count in _merge_rects(rects, FIGURE_GAP):
+        if any(abs(region & image) > 0.5 * abs(region) for image in image_rects):
+            continue
+        if _caption_near(region, table_captions) and not _caption_near(
+            region, figure_captions
+        ):
+            continue
+        if count < FIGURE_MIN_PATHS and not _caption_near(region, figure_captions):
+            continue
+        search = region + (-LABEL_MARGIN, -LABEL_MARGIN, LABEL_MARGIN, LABEL_MARGIN)
+        for block in blocks:
+            rect = fitz.Rect(block[:4])
+            if rect in search and not any(rect == c for c in caption_rects):
+                region |= rect
+        region = (region + (-2, -2, 2, 2)) & page.rect
+        if min(region.width, region.height) >= FIGURE_MIN_SIDE:
+            regions.append(region)
+    return regions
+
+
+def _render_figures(pdf_path, image_folder, dpi, page_nums):
+    """Render the figure regions of `page_nums`; returns the written file names.
+
+    Figures are numbered after the page's embedded images, so names stay
+    page{n}_img{i} without clashing with raster extraction.
+    """
+    written = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_nums:
+            page = doc[page_num - 1]
+            offset = len(doc.get_page_images(page_num - 1))
+            for j, rect in enumerate(find_figure_regions(page), start=1):
+                image_filename = f"page{page_num}_img{offset + j}.png"
+                pix = page.get_pixmap(dpi=dpi, clip=rect)
+                pix.save(os.path.join(image_folder, image_filename))
+                written.append(image_filename)
+    return written
+
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def extract_vector_figures(
+    pdf_path, image_folder, dpi=VECTOR_DPI, workers=1, cache_dir=None
+):
+    """Rasterize the PDF's vector figures into `image_folder` at `dpi`.
+
+    With `cache_dir`, renders are kept under the PDF's content hash and
+    reused by later calls for the same PDF and DPI.
+    """
+    os.makedirs(image_folder, exist_ok=True)
+    entry = None
+    if cache_dir:
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        key = f"{digest.hexdigest()}-{dpi}dpi-v{FIGURE_VERSION}"
+        entry = os.path.join(cache_dir, key)
+        index = os.path.join(entry, "figures.json")
+        if os.path.exists(index):
+            with open(index, "r", encoding="utf-8") as f:
+                names = json.load(f)
+            for name in names:
+                _link_or_copy(
+                    os.path.join(entry, name), os.path.join(image_folder, name)
+                )
+            return names
+
+    out_dir = image_folder
+    if entry:
+        out_dir = f"{entry}.{os.getpid()}.tmp"
+        os.makedirs(out_dir, exist_ok=True)
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    names = _run_in_chunks(
+        partial(_render_figures, pdf_path, out_dir, dpi),
+        list(range(1, page_count + 1)),
+        lambda page_num: page_num,
+        page_count,
+        workers,
+    )
+    if entry:
+        with open(os.path.join(out_dir, "figures.json"), "w", encoding="utf-8") as f:
+            json.dump(names, f)
+        try:
+            os.replace(out_dir, entry)
+        except OSError:  # another process cached the same PDF first
+            shutil.rmtree(out_dir, ignore_errors=True)
+        for name in names:
+            _link_or_copy(os.path.join(entry, name), os.path.join(image_folder, name))
+    return names
+
+
+def extract_images_from_pdf(
+    pdf_path,
+    image_folder,
+    code_folder,
+    workers=1,
+    mode=IMAGE_MODE,
+    dpi=VECTOR_DPI,
+    cache_dir=None,
+):
+    """Write each distinct image of the PDF once, as page{n}_img{i}.{ext}.
+
+    Images are deduplicated by xref and by content hash, and filtered on
+    their size before being decoded. In "vector" and "both" modes, figures
+    drawn as vector paths are rendered as well (see extract_vector_figures).
+    With `workers` > 1, PDFs with at least PARALLEL_MIN_PAGES pages are split
+    into page ranges over that many processes. The default stays at one:
+    process start-up and re-opening the PDF per range cost more than they
+    save in benchmarks/bench_extract_images.py.
+    """
+    if mode not in IMAGE_MODES:
+        raise ValueError(f"Unknown image extraction mode: {mode}")
+    os.makedirs(image_folder, exist_ok=True)
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+        plan = plan_images(doc) if mode != "vector" else []
+
+    written = _run_in_chunks(
+        partial(_extract, pdf_path, image_folder),
+        plan,
+        lambda item: item[0],
+        page_count,
+        workers,
+    )
+
+    # Different xrefs in different page ranges can still hold the same bytes.
+    hashes = set()
+    kept = []
+    for image_filename, sha256 in written:
+        if sha256 in hashes:
+            os.remove(os.path.join(image_folder, image_filename))
+            continue
+        hashes.add(sha256)
+        kept.append(image_filename)
+
+    if mode != "raster":
+        kept += extract_vector_figures(pdf_path, image_folder, dpi, workers, cache_dir)
+
+    if not kept:
         shutil.rmtree(image_folder)
-        shutil.rmtree(code_folder, onerror=on_rm_error)
+        if os.path.exists(code_folder):  # callers may pass the image folder
+            shutil.rmtree(code_folder, onerror=on_rm_error)
         raise ValueError("No images detected in the pdf.")
+    return kept
 
 
 def process_pdfs(gather_data_folder, pdfs_folder):
@@ -44,7 +329,7 @@ def process_pdfs(gather_data_folder, pdfs_folder):
 
         # if os.path.exists(pdf_path):
         print(f"Processing {pdf_filename}...")
-        extract_images_from_pdf(pdf_path, folder_path)
+        extract_images_from_pdf(pdf_path, folder_path, folder_path)
         # else:
         #     print(f"PDF not found for folder: {folder_name}")
 
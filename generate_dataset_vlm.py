@@ -1,17 +1,29 @@
+import asyncio
+import json
 import os
 import glob
 import shutil
 import re
 import enum
+import time
 from google import genai
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from tqdm import tqdm
-import subprocess
 
 
 from PIL import Image
 
+from dataset_export import META_SUFFIX, export_dataset
+from image_dedupe import CORPUS_HASH_FILE, HashIndex, dedupe_images
+from image_filter import prefilter
+from code_executor import CodeExecutor
+from code_index import CodeIndex
+from image_packing import pack_batches, prepare_image, text_tokens
+from metrics import default_metrics
+from similarity import score_outputs
+from vlm_client import VlmClient
+
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -20,6 +32,8 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 class ScientificFormat(BaseModel):
     explanation: str
     scientific_figures: list[int]
+    # One per entry of scientific_figures; used to find the relevant code.
+    figure_descriptions: list[str] = []
 
 
 class ReplicatedCode(BaseModel):
@@ -31,11 +45,46 @@ class ReplicatedCode(BaseModel):
 client = genai.Client(api_key=GEMINI_API_KEY)
 
 GEMINI_MODEL = "gemini-2.5-flash"
+GEMINI_CONCURRENCY = 4
+GEMINI_RPM = 60
+GEMINI_TPM = 250_000
+PROJECT_CONCURRENCY = 4
+REPLICATION_MAX_SIDE = 1536  # the replication call gets a sharper image
+EXECUTOR_WORKERS = 4
+VLM_CACHE_DB = "vlm_cache.sqlite"
+METRICS_FILE = "metrics.json"
 
 FIGURE_LIBRARIES = ["matplotlib", "seaborn", "plotly", "bokeh", "altair", "ggplot"]
 IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".gif"]
 
 
+_vlm = None
+
+
+def default_vlm() -> VlmClient:
+    global _vlm
+    if _vlm is None:
+        _vlm = VlmClient(
+            client,
+            GEMINI_MODEL,
+            concurrency=GEMINI_CONCURRENCY,
+            rpm=GEMINI_RPM,
+            tpm=GEMINI_TPM,
+            cache_path=VLM_CACHE_DB,
+        )
+    return _vlm
+
+
+_executor = None
+
+
+def default_executor() -> CodeExecutor:
+    global _executor
+    if _executor is None:
+        _executor = CodeExecutor(workers=EXECUTOR_WORKERS)
+    return _executor
+
+
 def group_images_by_page(images):
     page_groups = {}
     pattern = r"page(\d+)_img(\d+)"
@@ -61,34 +110,35 @@ def select_images_from_page_group(img_tuples):
     return [img[1] for img in img_tuples]
 
 
-def batch_check_scientific_figures_gemini(image_paths):
-    prompt = f"""
-You will be given {len(image_paths)} images. Determine which of these images are plotted figures (meaning it was entirely created by any of these libraries: matplotlib, seaborn, plotly, bokeh, altair, ggplot.) and then return their indices. 
-The indices you return should start from 0. (The first image has index 0 and the last image index {len(image_paths)-1})
+def scientific_figures_prompt(count):
+    return f"""
+You will be given {count} images. Determine which of these images are plotted figures (meaning it was entirely created by any of these libraries: matplotlib, seaborn, plotly, bokeh, altair, ggplot.) and then return their indices. 
+The indices you return should start from 0. (The first image has index 0 and the last image index {count-1})
 List your answers in the same order as the images are presented.
+For each index you return, also give a one-line description of that figure in figure_descriptions (chart type, axis labels, title, legend entries), in the same order.
 Include a very brief explanation for your answer.
 
 **If multiple images are very similar in styles (for example bar charts with similar number of lines but different data inside), return the index of only one of them to reduce the post processing burden.**
 """
-    contents = [{"text": prompt}]
-    for index in range(len(image_paths)):
-        img_path = image_paths[index]
-        with open(img_path, "rb") as img_file:
-            img_bytes = img_file.read()
 
+
+async def batch_check_scientific_figures_gemini(images, vlm=None):
+    """(index, description) of the plots among `images` (PreparedImage, see
+    image_packing)."""
+    contents = [{"text": scientific_figures_prompt(len(images))}]
+    for index, image in enumerate(images):
         contents.append({"text": f"Image {index}"})
-        contents.append({"inline_data": {"mime_type": "image/png", "data": img_bytes}})
-
-    response = client.models.generate_content(
-        model=GEMINI_MODEL,
-        contents=[{"role": "user", "parts": contents}],
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": ScientificFormat,
-        },
+        contents.append(image.part())
+
+    vlm = vlm or default_vlm()
+    answers: ScientificFormat = await vlm.generate(
+        [{"role": "user", "parts": contents}], ScientificFormat
     )
-    answers: ScientificFormat = response.parsed
-    return answers.scientific_figures
+    descriptions = answers.figure_descriptions
+    return [
+        (idx, descriptions[i] if i < len(descriptions) else "")
+        for i, idx in enumerate(answers.scientific_figures)
+    ]
 
 
 def find_python_files(folder):
@@ -105,42 +155,81 @@ def get_image_files(folder):
     ]
 
 
-def process_project(project, github_dir, output_dir):
+async def process_project(
+    project, github_dir, output_dir, hash_index=None, vlm=None, executor=None
+):
     extracted_code_path = os.path.join(github_dir, project)
     extracted_image_path = os.path.join(output_dir, project)
+    metrics = default_metrics()
     images = get_image_files(extracted_image_path)
     py_files = find_python_files(extracted_code_path)
     if (not images) or (not py_files) or len(images) > 16:
+        reason = (
+            "no images" if not images else "no code" if not py_files else "too many images"
+        )
+        metrics.outcome("project", "skipped", reason)
         return None
     print(f"Processing project: {project}")
 
+    # Near-identical figures (and, with a corpus index, figures already seen
+    # in other projects) never reach the API.
+    found = len(images)
+    images = dedupe_images(images, project, hash_index)
+    metrics.outcome("image", "skipped", "duplicate", found - len(images))
+    # Photos, logos and the like are dropped locally; uncertain images go on.
+    found = len(images)
+    images = [img for img, keep in zip(images, prefilter(images)) if keep]
+    metrics.outcome("image", "skipped", "prefilter", found - len(images))
     page_groups = group_images_by_page(images)
     images_to_check = []
 
     for img_tuples in page_groups.values():
         images_to_check.extend(select_images_from_page_group(img_tuples))
 
-    batch_size = 4
+    vlm = vlm or default_vlm()
+    prepared = [prepare_image(img_path) for img_path in images_to_check]
+    prepared = [image for image in prepared if image is not None]
+    metrics.outcome(
+        "image", "skipped", "unreadable", len(images_to_check) - len(prepared)
+    )
+    # Downscaled images are packed into as few requests as the token budget allows.
+    batches = pack_batches(
+        prepared,
+        prompt_tokens=text_tokens(scientific_figures_prompt(len(prepared))),
+        per_image_tokens=text_tokens("Image 00"),
+    )
+    results = await asyncio.gather(
+        *(batch_check_scientific_figures_gemini(batch, vlm) for batch in batches)
+    )
     confirmed_figures = []
-    for i in range(0, len(images_to_check), batch_size):
-        batch = images_to_check[i : i + batch_size]
-        passed_indices = batch_check_scientific_figures_gemini(batch)
+    for batch, passed in zip(batches, results):
         passed_figures = [
-            batch[idx] for idx in passed_indices if idx < len(batch)
+            (batch[idx].path, description)
+            for idx, description in passed
+            if idx < len(batch)
         ]
         confirmed_figures.extend(passed_figures)
+    metrics.incr("figures_confirmed", len(confirmed_figures))
+
+    # Only the plotting code relevant to each figure goes into its prompt.
+    code_index = CodeIndex.from_folder(extracted_code_path)
+    all_codes = None
+    if not code_index.chunks:
+        codes = []
+        for py_file in py_files:
+            with open(py_file, "r", encoding="utf-8") as f:
+                codes.append(f"# File: {os.path.basename(py_file)}\n{f.read()}")
+        all_codes = "\n\n".join(codes)
+
+    executor = executor or default_executor()
+
+    async def replicate(img_path, description):
+        image = prepare_image(img_path, REPLICATION_MAX_SIDE)
+        if image is None:
+            metrics.outcome("replicate", "skipped", "unreadable image")
+            return None
+        code_context = all_codes or code_index.context(description)
 
-    codes = []
-    for py_file in py_files:
-        with open(py_file, "r", encoding="utf-8") as f:
-            codes.append(f"# File: {os.path.basename(py_file)}\n{f.read()}")
-    all_codes = "\n\n".join(codes)
-
-    for img_path in confirmed_figures:
-        
-        with open(img_path, "rb") as img_file:
-            image_bytes = img_file.read()
-        
         prompt = f"""
 Given this scientific figure and the Python code below, determine if any of the provided code likely produce this figure? (Some differences in the overall style do NOT matter e.g. color, label name, ...)
 
@@ -153,31 +242,21 @@ If the code was generated you need to produce a description for the code else re
 It should NOT be a details explanation of each line but rather an overall request to carry out a certain task.
 
 PYTHON CODE:
-{all_codes}
+{code_context}
 """
 
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=[
+        parsed_response: ReplicatedCode = await vlm.generate(
+            [
                 {
                     "role": "user",
                     "parts": [
                         {"text": prompt},
-                        {
-                            "inline_data": {
-                                "mime_type": "image/png",
-                                "data": image_bytes,
-                            }
-                        },
+                        image.part(),
                     ],
                 }
             ],
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": ReplicatedCode,
-            },
+            ReplicatedCode,
         )
-        parsed_response: ReplicatedCode = response.parsed
         print("^ " * 50)
         print(img_path)
         print(parsed_response.code)
@@ -186,7 +265,8 @@ PYTHON CODE:
             or not parsed_response.generated
             or not parsed_response.code
         ):
-            continue
+            metrics.outcome("replicate", "skipped", "no matching code")
+            return None
 
         out_proj_dir = os.path.join(output_dir, project)
         os.makedirs(out_proj_dir, exist_ok=True)
@@ -201,35 +281,125 @@ PYTHON CODE:
         with open(gen_code_path, "w", encoding="utf-8") as f:
             f.write(parsed_response.code)
 
-        # Run the code to get the image
-        subprocess.run(
-            ["python", code_filename],
-            cwd=out_proj_dir,
-            timeout=30,
-            check=True,
-        )
-
-        # After running, check if output.png was created
+        # Run the code in the sandbox to get the image
         replicated_image_path = os.path.join(
             out_proj_dir, f"{base_img}_replicated.png"
         )
-        default_output = os.path.join(out_proj_dir, "output.png")
-
-        if os.path.exists(default_output):
-            os.rename(default_output, replicated_image_path)
+        async with slots:
+            result = await asyncio.to_thread(
+                executor.run,
+                parsed_response.code,
+                replicated_image_path,
+                code_filename,
+            )
+        # Descriptions and provenance for dataset_export.
+        with open(
+            os.path.join(out_proj_dir, base_img + META_SUFFIX), "w", encoding="utf-8"
+        ) as f:
+            json.dump(
+                {
+                    "project": project,
+                    "source_image": img_path,
+                    "figure_description": description,
+                    "code_description": parsed_response.code_description,
+                    "execution_status": result.status,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        if not result.ok:
+            stderr = result.stderr.strip().splitlines()
+            print(
+                f"[WARN] Generated code for {img_path} failed ({result.status}): "
+                f"{stderr[-1] if stderr else ''}"
+            )
+            metrics.outcome("replicate", "failed", result.status)
+            return None
+
+        if result.image_path:
             print(f"Replicated image saved as: {replicated_image_path}")
         else:
             print(f"[WARN] No output.png found for {img_path}")
 
+        metrics.outcome("replicate", "success")
         return parsed_response.code_description
 
-def main(data_dir, output_dir):
+    # Figures are replicated concurrently, up to one per executor worker in
+    # execution; the project's description is that of the first figure
+    # replicated, in figure order.
+    slots = asyncio.Semaphore(executor.workers)
+    descriptions = await asyncio.gather(
+        *(replicate(path, description) for path, description in confirmed_figures)
+    )
+    return next((d for d in descriptions if d), None)
+
+
+async def process_projects(projects, data_dir, output_dir, hash_index, vlm, executor):
+    """Run up to PROJECT_CONCURRENCY projects at once; API calls share `vlm`."""
+    semaphore = asyncio.Semaphore(PROJECT_CONCURRENCY)
+    progress = tqdm(total=len(projects))
+
+    metrics = default_metrics()
+
+    async def run(project):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                return await process_project(
+                    project, data_dir, output_dir, hash_index, vlm, executor
+                )
+            except Exception as e:
+                print(f"Error processing {project}: {e}")
+                metrics.outcome("project", "failed", type(e).__name__)
+            finally:
+                metrics.observe("project", time.perf_counter() - start, key=project)
+                progress.update()
+
+    try:
+        return await asyncio.gather(*(run(project) for project in projects))
+    finally:
+        progress.close()
+
+
+def main(
+    data_dir, output_dir, corpus_dedupe=True, vlm=None, score=True, export_dir=None
+):
+    global _executor, _vlm
+
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    for root, dirs, files in os.walk(data_dir):
-        for project in tqdm(dirs):
-            process_project(project, data_dir, output_dir)
+    hash_index = None
+    if corpus_dedupe:
+        hash_index = HashIndex(os.path.join(output_dir, CORPUS_HASH_FILE))
+    own_vlm = vlm is None  # a client passed in is left open for the caller
+    vlm = vlm or default_vlm()
+    executor = default_executor()
+    projects = [project for _, dirs, _ in os.walk(data_dir) for project in dirs]
+    try:
+        asyncio.run(
+            process_projects(projects, data_dir, output_dir, hash_index, vlm, executor)
+        )
+    finally:
+        executor.close()
+        _executor = None  # a later default_executor() starts fresh workers
+        if hash_index is not None:
+            hash_index.save()
+        print(f"Gemini calls: {vlm.calls}, cached responses: {vlm.cache_hits}")
+        if own_vlm:
+            vlm.close()
+            _vlm = None
+    metrics = default_metrics()
+    if score:
+        # Original/replicated similarity, for filtering the dataset later.
+        with metrics.timer("score"):
+            print(f"Scored {score_outputs(output_dir)} replicated figures")
+    if export_dir:
+        with metrics.timer("export"):
+            summary = export_dataset(output_dir, export_dir)
+        print(f"Exported {summary['exported']} samples into {summary['shards']} shards")
+    print(metrics.summary())
+    metrics.write(os.path.join(output_dir, METRICS_FILE))
 
 
 if __name__ == "__main__":
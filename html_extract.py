@@ -0,0 +1,178 @@
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+except ImportError:  # optional, falls back to BeautifulSoup
+    lxml = None
+
+
+def _has_classes(value, required):
+    return required.issubset((value or "").split())
+
+
+class SoupExtractor:
+    """BeautifulSoup tree parse; the reference implementation and fallback."""
+
+    name = "soup"
+
+    def __init__(self, features="html.parser"):
+        self.features = features
+
+    def listing_links(self, html: str) -> List[str]:
+        soup = BeautifulSoup(html, self.features)
+        links = []
+        for paper in soup.find_all("div", class_="infinite-item"):
+            page_link = paper.find("a", class_="badge badge-dark")
+            if page_link:
+                links.append(page_link.get("href", ""))
+        return links
+
+    def paper_links(self, html: str) -> Tuple[Optional[str], Optional[str]]:
+        soup = BeautifulSoup(html, self.features)
+        github_a = soup.find("a", href=lambda x: x and "github.com" in x)
+        pdf_a = soup.find("a", href=lambda x: x and ".pdf" in x)
+        return (
+            github_a["href"].strip() if github_a else None,
+            pdf_a["href"].strip() if pdf_a else None,
+        )
+
+
+class LxmlExtractor:
+    """libxml2 parse with XPath selection of the anchors we need."""
+
+    name = "lxml"
+    ITEM_XPATH = (
+        "//div[contains(concat(' ', normalize-space(@class), ' '), ' infinite-item ')]"
+    )
+    BADGE_XPATH = (
+        "(.//a[contains(concat(' ', normalize-space(@class), ' '), ' badge ')"
+        " and contains(concat(' ', normalize-space(@class), ' '), ' badge-dark ')])[1]"
+    )
+
+    def _parse(self, html):
+        # fromstring raises on empty, whitespace-only or comment-only input,
+        # where the other extractors just find nothing.
+        try:
+            return lxml.html.fromstring(html)
+        except lxml.etree.ParserError:
+            return None
+
+    def listing_links(self, html: str) -> List[str]:
+        root = self._parse(html)
+        if root is None:
+            return []
+        links = []
+        for item in root.xpath(self.ITEM_XPATH):
+            badge = item.xpath(self.BADGE_XPATH)
+            if badge:
+                links.append(badge[0].get("href", ""))
+        return links
+
+    def paper_links(self, html: str) -> Tuple[Optional[str], Optional[str]]:
+        root = self._parse(html)
+        if root is None:
+            return None, None
+        github = root.xpath("(//a[contains(@href, 'github.com')])[1]/@href")
+        pdf = root.xpath("(//a[contains(@href, '.pdf')])[1]/@href")
+        return (
+            github[0].strip() if github else None,
+            pdf[0].strip() if pdf else None,
+        )
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _AnchorParser(HTMLParser):
+    """Streams start/end tags, keeping only the anchors we need."""
+
+    def __init__(self, listing):
+        super().__init__(convert_charrefs=False)
+        self.listing = listing
+        self.links = []
+        self.item_depth = None  # div depth of the current infinite-item
+        self.depth = 0
+        self.item_found = False
+        self.github = None
+        self.pdf = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.listing:
+            if tag == "div":
+                self.depth += 1
+                if self.item_depth is None and _has_classes(
+                    dict(attrs).get("class"), {"infinite-item"}
+                ):
+                    self.item_depth = self.depth
+                    self.item_found = False
+            elif tag == "a" and self.item_depth is not None and not self.item_found:
+                attrs = dict(attrs)
+                if _has_classes(attrs.get("class"), {"badge", "badge-dark"}):
+                    self.links.append(attrs.get("href") or "")
+                    self.item_found = True
+            return
+        if tag != "a":
+            return
+        href = dict(attrs).get("href")
+        if not href:
+            return
+        if self.github is None and "github.com" in href:
+            self.github = href.strip()
+        if self.pdf is None and ".pdf" in href:
+            self.pdf = href.strip()
+        if self.github is not None and self.pdf is not None:
+            raise _StopParsing
+
+    def handle_endtag(self, tag):
+        if self.listing and tag == "div":
+            if self.item_depth == self.depth:
+                self.item_depth = None
+            self.depth -= 1
+
+
+class AnchorExtractor:
+    """Selective streaming parse without building a tree.
+
+    Paper pages stop parsing as soon as both links have been seen.
+    """
+
+    name = "anchors"
+
+    def _run(self, html, listing):
+        parser = _AnchorParser(listing)
+        try:
+            parser.feed(html)
+            parser.close()
+        except _StopParsing:
+            pass
+        return parser
+
+    def listing_links(self, html: str) -> List[str]:
+        return self._run(html, listing=True).links
+
+    def paper_links(self, html: str) -> Tuple[Optional[str], Optional[str]]:
+        parser = self._run(html, listing=False)
+        return parser.github, parser.pdf
+
+
+EXTRACTORS = {
+    SoupExtractor.name: SoupExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+    AnchorExtractor.name: AnchorExtractor,
+}
+
+
+def get_extractor(name=None):
+    """Extractor by name; defaults to lxml when installed, else BeautifulSoup."""
+    if name is None:
+        name = LxmlExtractor.name if lxml is not None else SoupExtractor.name
+    if name == LxmlExtractor.name and lxml is None:
+        print("lxml is not installed, falling back to BeautifulSoup")
+        name = SoupExtractor.name
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor: {name}")
+    return EXTRACTORS[name]()
@@ -0,0 +1,151 @@
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = (10, 60)  # (connect, read) seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+HTTP_CACHE_FILE = "./http_cache.json"
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """Pooled keep-alive session with retries, backoff and conditional GETs."""
+
+    def __init__(
+        self,
+        timeout=DEFAULT_TIMEOUT,
+        max_retries=4,
+        backoff=1.0,
+        max_backoff=60.0,
+        pool_size=16,
+        cache_file=None,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache_file = cache_file
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self.validators = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as f:
+                self.validators = json.load(f)
+
+    def _delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        # Full jitter: uniform over [0, backoff * 2^attempt].
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def get(self, url, conditional=False, remember=True, **kwargs):
+        """GET with retries on 429/5xx and connection errors.
+
+        With `conditional=True` the stored ETag/Last-Modified for `url` are
+        sent, so an unchanged resource comes back as a bodiless 304. A 200's
+        validators are stored right away unless `remember=False`, in which
+        case the caller passes the response to `remember` once it is done
+        with it.
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        if conditional:
+            with self._lock:
+                cached = self.validators.get(url, {})
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            delay = self._delay(attempt, response)
+            response.close()
+            time.sleep(delay)
+
+        if conditional and remember and response.status_code == 200:
+            self.remember(url, response)
+        return response
+
+    def remember(self, url, response):
+        validators = {}
+        if response.headers.get("ETag"):
+            validators["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            validators["last_modified"] = response.headers["Last-Modified"]
+        if validators:
+            with self._lock:
+                self.validators[url] = validators
+
+    def forget(self, url):
+        with self._lock:
+            self.validators.pop(url, None)
+
+    def save(self):
+        if not self.cache_file:
+            return
+        with self._lock:
+            data = json.dumps(self.validators)
+        tmp = self.cache_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.cache_file)
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> HttpClient:
+    """The process-wide client shared by every module."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient(cache_file=HTTP_CACHE_FILE)
+        return _default_client
+
+
+def configure(**kwargs) -> HttpClient:
+    """Replace the shared client, e.g. to change timeouts or retry policy."""
+    global _default_client
+    with _default_lock:
+        if _default_client is not None:
+            _default_client.close()
+        kwargs.setdefault("cache_file", HTTP_CACHE_FILE)
+        _default_client = HttpClient(**kwargs)
+        return _default_client
@@ -0,0 +1,160 @@
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8  # 8x8 bits, one 64-bit integer per hash
+PHASH_DISTANCE = 6  # max differing bits between near-duplicates
+DHASH_DISTANCE = 10
+CORPUS_HASH_FILE = "image_hashes.json"
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] /= np.sqrt(2)
+    return m * np.sqrt(2 / n)
+
+
+_DCT = _dct_matrix(HASH_SIZE * 4)
+_BIT_WEIGHTS = 1 << np.arange(HASH_SIZE * HASH_SIZE, dtype=np.uint64)[::-1]
+_POPCOUNT = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+def _pack(bits) -> int:
+    return int((bits.ravel().astype(np.uint64) * _BIT_WEIGHTS).sum())
+
+
+def _load_gray(path, size):
+    with Image.open(path) as img:
+        img.draft("L", (size, size))  # JPEGs decode at reduced scale
+        if img.mode in ("RGBA", "LA", "P"):
+            # Transparent areas render as white in the paper.
+            img = img.convert("RGBA")
+            background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img)
+        return img.convert("L")
+
+
+def phash(img: Image.Image) -> int:
+    """DCT hash: low-frequency coefficients above their median."""
+    size = HASH_SIZE * 4
+    pixels = np.asarray(img.resize((size, size), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+def dhash(img: Image.Image) -> int:
+    """Gradient hash: is each pixel brighter than its right neighbour."""
+    pixels = np.asarray(img.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def image_hashes(path):
+    img = _load_gray(path, HASH_SIZE * 4)
+    return phash(img), dhash(img)
+
+
+def _distances(hashes, value):
+    """Hamming distance of every hash in a uint64 array to `value`."""
+    xor = hashes ^ np.uint64(value)
+    return _POPCOUNT[xor.view(np.uint16).reshape(-1, 4)].sum(axis=1)
+
+
+class HashIndex:
+    """Perceptual hashes of images already kept, for near-duplicate lookups.
+
+    Entries remember their project, so an index saved across runs never
+    reports a project's images as duplicates of themselves.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.phashes = np.empty(0, dtype=np.uint64)
+        self.dhashes = np.empty(0, dtype=np.uint64)
+        self.entries = []  # (project, image path)
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+            self.phashes = np.array([int(r[0], 16) for r in rows], dtype=np.uint64)
+            self.dhashes = np.array([int(r[1], 16) for r in rows], dtype=np.uint64)
+            self.entries = [(r[2], r[3]) for r in rows]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, hashes, project=None) -> Optional[str]:
+        """Path of a near-duplicate from another project, or None."""
+        if not self.entries:
+            return None
+        ph, dh = hashes
+        close = (_distances(self.phashes, ph) <= PHASH_DISTANCE) & (
+            _distances(self.dhashes, dh) <= DHASH_DISTANCE
+        )
+        for i in np.flatnonzero(close):
+            if project is None or self.entries[i][0] != project:
+                return self.entries[i][1]
+        return None
+
+    def add(self, hashes, project, path):
+        self.phashes = np.append(self.phashes, np.uint64(hashes[0]))
+        self.dhashes = np.append(self.dhashes, np.uint64(hashes[1]))
+        self.entries.append((project, path))
+
+    def drop_project(self, project):
+        keep = [i for i, entry in enumerate(self.entries) if entry[0] != project]
+        self.phashes = self.phashes[keep]
+        self.dhashes = self.dhashes[keep]
+        self.entries = [self.entries[i] for i in keep]
+
+    def save(self, path=None):
+        path = path or self.path
+        rows = [
+            [f"{int(ph):016x}", f"{int(dh):016x}", project, image]
+            for ph, dh, (project, image) in zip(
+                self.phashes, self.dhashes, self.entries
+            )
+        ]
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rows, f)
+        os.replace(tmp, path)
+
+
+def dedupe_images(paths: List[str], project=None, corpus: HashIndex = None) -> List[str]:
+    """One representative per cluster of near-identical images, in input order.
+
+    The largest image of a cluster is kept. With `corpus`, images that
+    duplicate another project's are dropped too, and the kept ones are
+    added to it.
+    """
+    sizes = {}
+    hashes = {}
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                sizes[path] = img.width * img.height
+            hashes[path] = image_hashes(path)
+        except OSError:
+            sizes[path] = 0  # unreadable: leave it to the caller
+
+    local = HashIndex()
+    kept = set()
+    for path in sorted(paths, key=lambda p: -sizes[p]):
+        if path not in hashes:
+            kept.add(path)
+            continue
+        if local.find(hashes[path]) is not None:
+            continue
+        if corpus is not None and corpus.find(hashes[path], project) is not None:
+            continue
+        local.add(hashes[path], project, path)
+        kept.add(path)
+
+    if corpus is not None:
+        corpus.drop_project(project)
+        for _, path in local.entries:
+            corpus.add(hashes[path], project, path)
+    return [path for path in paths if path in kept]
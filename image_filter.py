@@ -0,0 +1,109 @@
+from typing import List
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+FEATURE_SIZE = 128  # images are compared as FEATURE_SIZE x FEATURE_SIZE
+BATCH_SIZE = 64
+WHITE_LEVEL = 235  # all channels above this count as background
+DARK_LEVEL = 160  # gray below this counts as ink
+TOP_COLORS = 8
+AXIS_MIN_FRACTION = 0.4  # an axis line spans this much of the image
+AXIS_GAP = 2  # px; next to an axis line, on at least one side ...
+AXIS_MAX_SIDE_FRACTION = 0.2  # ... at most this much is ink
+
+# Only images without any axis line are ever dropped; of those, the ones
+# with little background or many colors look like photos, screenshots or
+# rendered scenes rather than charts.
+MIN_WHITE_RATIO = 0.25
+MIN_TOP_COLOR_COVERAGE = 0.5
+
+
+def _load(path):
+    with Image.open(path) as img:
+        img.draft("RGB", (FEATURE_SIZE, FEATURE_SIZE))
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img)
+        img = img.convert("RGB")
+        rgb = img.resize((FEATURE_SIZE, FEATURE_SIZE), Image.BOX)
+        # Thin lines would fade into the background when downscaled; a min
+        # filter first keeps them dark.
+        gray = img.convert("L")
+        scale = max(gray.size) // FEATURE_SIZE
+        if scale >= 2:
+            gray = gray.filter(ImageFilter.MinFilter(min(scale | 1, 9)))
+        gray = gray.resize((FEATURE_SIZE, FEATURE_SIZE), Image.BOX)
+    return np.asarray(rgb), np.asarray(gray)
+
+
+def load_batch(paths):
+    """(rgb, gray, readable) arrays for `paths`; unreadable images are blank."""
+    size = FEATURE_SIZE
+    rgb = np.full((len(paths), size, size, 3), 255, dtype=np.uint8)
+    gray = np.full((len(paths), size, size), 255, dtype=np.uint8)
+    readable = np.zeros(len(paths), dtype=bool)
+    for i, path in enumerate(paths):
+        try:
+            rgb[i], gray[i] = _load(path)
+        except (OSError, ValueError):
+            continue
+        readable[i] = True
+    return rgb, gray, readable
+
+
+def _has_line(ink):
+    """Rows (N, H) of ink fractions -> whether each image has a thin long line.
+
+    Dark bands in photos are not lines: a line needs light rows beside it.
+    """
+    light = ink < AXIS_MAX_SIDE_FRACTION
+    edge = np.zeros((len(ink), AXIS_GAP), dtype=bool)
+    before = np.concatenate([edge, light[:, :-AXIS_GAP]], axis=1)
+    after = np.concatenate([light[:, AXIS_GAP:], edge], axis=1)
+    return ((ink >= AXIS_MIN_FRACTION) & (before | after)).any(axis=1)
+
+
+def image_features(rgb, gray):
+    """Per-image features of a batch, each an array of length N."""
+    n = len(rgb)
+    pixels = FEATURE_SIZE * FEATURE_SIZE
+    white_ratio = (rgb > WHITE_LEVEL).all(axis=3).reshape(n, -1).mean(axis=1)
+
+    # 4 bits per channel; one bincount over the whole batch.
+    codes = (rgb >> 4).astype(np.int64)
+    codes = (codes[..., 0] << 8) | (codes[..., 1] << 4) | codes[..., 2]
+    codes = codes.reshape(n, -1) + (np.arange(n) * 4096)[:, None]
+    histogram = np.bincount(codes.ravel(), minlength=n * 4096).reshape(n, 4096)
+    top = np.sort(histogram, axis=1)[:, -TOP_COLORS:].sum(axis=1)
+
+    dark = gray < DARK_LEVEL
+    has_hline = _has_line(dark.mean(axis=2))
+    has_vline = _has_line(dark.mean(axis=1))
+    return {
+        "white_ratio": white_ratio,
+        "top_color_coverage": top / pixels,
+        "color_count": (histogram > 0).sum(axis=1),
+        "has_hline": has_hline,
+        "has_vline": has_vline,
+    }
+
+
+def is_non_plot(features):
+    """True where an image is clearly not a chart; uncertain ones are False."""
+    no_axes = ~(features["has_hline"] | features["has_vline"])
+    photo_like = (features["white_ratio"] < MIN_WHITE_RATIO) | (
+        features["top_color_coverage"] < MIN_TOP_COLOR_COVERAGE
+    )
+    return no_axes & photo_like
+
+
+def prefilter(paths: List[str], batch_size=BATCH_SIZE) -> List[bool]:
+    """Which images to send on to the VLM; unreadable images are passed through."""
+    keep = []
+    for i in range(0, len(paths), batch_size):
+        rgb, gray, readable = load_batch(paths[i : i + batch_size])
+        drop = is_non_plot(image_features(rgb, gray)) & readable
+        keep.extend((~drop).tolist())
+    return keep
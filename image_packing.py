@@ -0,0 +1,137 @@
+import io
+import math
+from dataclasses import dataclass
+from typing import List, Optional
+
+from PIL import Image
+
+IMAGE_TILE = 768  # Gemini bills images in 768x768 tiles ...
+SMALL_IMAGE_SIDE = 384  # ... except small ones, which are a single tile
+TILE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+MAX_IMAGE_SIDE = IMAGE_TILE  # one tile per image is plenty to tell a plot
+REQUEST_TOKEN_BUDGET = 4096
+MAX_IMAGES_PER_REQUEST = 12
+MAX_REQUEST_BYTES = 16 << 20  # inline data limit is 20 MB per request
+JPEG_QUALITY = 90
+
+# MIME types Gemini accepts inline; anything else is re-encoded as PNG.
+SUPPORTED_MIME_TYPES = {"image/png", "image/jpeg", "image/webp"}
+
+_MAGIC = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+
+
+def detect_mime(data: bytes) -> str:
+    """MIME type from the file's magic bytes, not its extension."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    return "application/octet-stream"
+
+
+def image_tokens(width, height) -> int:
+    if max(width, height) <= SMALL_IMAGE_SIDE:
+        return TILE_TOKENS
+    return math.ceil(width / IMAGE_TILE) * math.ceil(height / IMAGE_TILE) * TILE_TOKENS
+
+
+def text_tokens(text) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class PreparedImage:
+    path: str
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    tokens: int
+
+    def part(self) -> dict:
+        return {"inline_data": {"mime_type": self.mime_type, "data": self.data}}
+
+
+def prepare_image(path, max_side=MAX_IMAGE_SIDE) -> Optional[PreparedImage]:
+    """Image bytes ready to send: at most `max_side` pixels a side, in a
+    format the API accepts. Files that already fit are sent unchanged.
+
+    Returns None for files that cannot be read or decoded.
+    """
+    try:
+        return _prepare_image(path, max_side)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+        # PIL raises OSError for truncated and unknown files, SyntaxError or
+        # ValueError for some corrupt headers.
+        print(f"Skipping unreadable image {path}: {e}")
+        return None
+
+
+def _prepare_image(path, max_side):
+    with open(path, "rb") as f:
+        data = f.read()
+    mime = detect_mime(data)
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        if max(width, height) <= max_side and mime in SUPPORTED_MIME_TYPES:
+            return PreparedImage(
+                path, data, mime, width, height, image_tokens(width, height)
+            )
+        if mime == "image/jpeg":
+            img.draft("RGB", (max_side, max_side))
+        img = img.copy()
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if mime == "image/jpeg":
+        img.convert("RGB").save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    else:
+        # Plots are line art: PNG keeps them sharp and compresses them well.
+        if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        img.save(out, "PNG", optimize=True)
+        mime = "image/png"
+    width, height = img.size
+    return PreparedImage(
+        path, out.getvalue(), mime, width, height, image_tokens(width, height)
+    )
+
+
+def pack_batches(
+    images: List[PreparedImage],
+    prompt_tokens=0,
+    token_budget=REQUEST_TOKEN_BUDGET,
+    max_images=MAX_IMAGES_PER_REQUEST,
+    max_bytes=MAX_REQUEST_BYTES,
+    per_image_tokens=0,
+) -> List[List[PreparedImage]]:
+    """Split images, in order, into requests that fit the token and byte
+    budgets; an image too large for any request goes alone."""
+    batches = []
+    batch, tokens, size = [], prompt_tokens, 0
+    for image in images:
+        cost = image.tokens + per_image_tokens
+        if batch and (
+            len(batch) >= max_images
+            or tokens + cost > token_budget
+            or size + len(image.data) > max_bytes
+        ):
+            batches.append(batch)
+            batch, tokens, size = [], prompt_tokens, 0
+        batch.append(image)
+        tokens += cost
+        size += len(image.data)
+    if batch:
+        batches.append(batch)
+    return batches
@@ -1,15 +1,23 @@
-import csv
+import argparse
 import enum
 import gzip
 import io
 import json
+import multiprocessing
 import os
+import re
 import shutil
-import stat
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 
-import pandas as pd
-import requests
+from downloader import DownloadResult, PdfDownloader, pdf_name
+from manifest import ManifestStore
+from metrics import PROFILERS, configure, default_metrics, reason_of
+from pipeline import Pipeline, Stage
+from scan_cache import ScanCache, file_record, outputs_present, remote_head
 
 DATA_DIR = Path("./data")
 GITHUB_DIR = Path("./data/git_snippets")
@@ -17,18 +25,19 @@ TMP_DIR = Path("./data/tmp")
 PDF_DIR = Path("./data/PDF")
 OUTPUT_DIR = Path("./data/output")
 IMAGE_DIR = Path("./data/images")
+FIGURE_CACHE_DIR = Path("./data/figure_cache")
 CSV_FILE = "./manifest.csv"
-CSV_FIELDS = [
-    "index",
-    "repo_url",
-    "paper_url_pdf",
-    "repo_name",
-    "description",
-    "status",
-    "error",
-]
-
-from extract_code import check_for_plotting_libraries, clone_repo, find_python_files
+MANIFEST_DB = "./manifest.sqlite"
+SCAN_CACHE_DB = "./data/scan_cache.sqlite"
+METRICS_FILE = "./data/metrics.json"
+PROFILE_DIR = "./data/profiles"
+
+from extract_code import (
+    DETECTOR_VERSION,
+    TMP_MAX_BYTES,
+    clone_repo,
+    scan_repository,
+)
 from extract_images import extract_images_from_pdf
 
 # from generate_dataset_vlm import process_project
@@ -39,69 +48,350 @@ class Format(str, enum.Enum):
     json_gz = "json.gz"
 
 
-def on_rm_error(func, path, exc_info):
-    os.chmod(path, stat.S_IWRITE)
-    func(path)
+# Skips everything up to the next bracket, stepping over whole strings.
+_JSON_SKIP = re.compile(r'[^\[\]{}"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^\[\]{}"]*)*', re.DOTALL)
+_JSON_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_JSON_SCALAR_END = re.compile(r"[\s,\]]")
+_JSON_SEPARATOR = re.compile(r"[\s,]*")
+
+
+def _json_element_end(buf, pos):
+    """End offset of the JSON element starting at buf[pos], or None if incomplete."""
+    if buf[pos] == '"':
+        m = _JSON_STRING.match(buf, pos)
+        return m.end() if m else None
+    if buf[pos] not in "[{":
+        m = _JSON_SCALAR_END.search(buf, pos)
+        return m.start() if m else None
+    depth = 0
+    while True:
+        pos = _JSON_SKIP.match(buf, pos).end()
+        if pos >= len(buf) or buf[pos] == '"':
+            return None  # ran out of data, possibly inside a string
+        depth += 1 if buf[pos] in "[{" else -1
+        pos += 1
+        if depth == 0:
+            return pos
 
 
-def load(filename, fmt=Format.json, encoding="utf-8"):
-    if fmt == Format.json:
-        with io.open(filename, mode="r", encoding=encoding) as fp:
-            return json.load(fp)
-    elif fmt == Format.json_gz:
-        with gzip.open(filename, mode="rb") as fp:
-            return json.loads(fp.read().decode(encoding))
+def iter_records(
+    filename,
+    fmt=Format.json_gz,
+    encoding="utf-8",
+    skip=(),
+    only=None,
+    chunk_size=1 << 20,
+):
+    """Lazily yield (index, record) from a file holding one top-level JSON array.
+
+    Elements are delimited with regexes that only stop at brackets, so only
+    the current element is held in memory. Elements whose index is in
+    `skip`, or not in `only` when given, are never decoded.
+    """
+    last = max(only, default=-1) if only is not None else None
+    if fmt == Format.json_gz:
+        fp = gzip.open(filename, mode="rt", encoding=encoding)
     else:
-        print("error")
+        fp = io.open(filename, mode="r", encoding=encoding)
+
+    with fp:
+        buf = ""
+        while "[" not in buf:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+        pos = buf.index("[") + 1
+        index = 0
+
+        while True:
+            pos = _JSON_SEPARATOR.match(buf, pos).end()
+            end = _json_element_end(buf, pos) if pos < len(buf) else None
+            if end is None:
+                chunk = fp.read(chunk_size)
+                if not chunk:
+                    if buf[pos:pos + 1] == "]":
+                        return
+                    raise ValueError(f"Truncated JSON array in {filename}")
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            if buf[pos] == "]":
+                return
 
+            if index not in skip and (only is None or index in only):
+                yield index, json.loads(buf[pos:end])
+            if last is not None and index >= last:
+                return
+            index += 1
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
 
-def process_repo(url: str):
-    repo_path = clone_repo(url, TMP_DIR)
-    py_files = find_python_files(repo_path)
-    flag = False
-    for py_file in py_files:
+
+def scan_repo(repo_path: Path, output_dir: Path):
+    """Copy a repo's plotting files to `output_dir`; returns their scan records."""
+    plotting_files = scan_repository(repo_path)
+    if not plotting_files:
+        return []
+    os.makedirs(output_dir, exist_ok=True)
+    files = []
+    for py_file, library in plotting_files:
         content = py_file.read_text(encoding="utf-8", errors="ignore")
-        if not check_for_plotting_libraries(content):
-            continue
-        flag = True
-        os.makedirs(f"{GITHUB_DIR}/{repo_path.name}", exist_ok=True)
-        orig_code_output_file = f"{GITHUB_DIR}/{repo_path.name}/{py_file.stem}.py"
+        output = f"{py_file.stem}.py"
+        orig_code_output_file = os.path.join(output_dir, output)
 
         with open(orig_code_output_file, "w", encoding="utf8") as f:
             f.write(content)
-    if not flag:
-        shutil.rmtree(repo_path, onerror=on_rm_error)
-        raise ValueError("No Plotting Code!")
+        files.append(file_record(repo_path, py_file, output, content, library))
+    return files
+
+
+def repo_dir(url: str) -> Path:
+    """<owner>/<repo>: where a repo's tree and outputs go under TMP_DIR,
+    GITHUB_DIR and IMAGE_DIR, so same-named repos of different owners stay
+    apart."""
+    parts = url.rstrip("/").split("/")
+    return Path(parts[-2] if len(parts) >= 2 else "_", parts[-1])
+
+
+_downloader = None
+_downloader_lock = threading.Lock()
 
 
-def download_pdf(download_link: str, name: str):
-    pdf_response = requests.get(download_link, stream=True)
-    pdf_filename = os.path.join(PDF_DIR, name + ".pdf")
+def download_pdf(download_link: str, name: str, key=None):
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = PdfDownloader(PDF_DIR)
+    return _downloader.fetch(download_link, name, key)
+
+
+@dataclass
+class Job:
+    index: int
+    repo_url: str
+    paper_url_pdf: str
+    repo_name: str
+    description: str = None
+    status: str = None
+    error: str = ""
+    failed_stage: str = None
+    repo_path: Path = None
+    head_sha: str = None
+    scan_cached: bool = False
+    pdf: DownloadResult = None
+    timings: dict = field(default_factory=dict)
+
+
+class ImageExtraction:
+    """Pipeline stage running extract_images_from_pdf in a process pool.
+
+    Keyed by PDF content hash, so a paper linked from several repos is
+    extracted once and copied to the other repos' image folders.
+    """
+
+    def __init__(self, pool, metrics=None):
+        self.pool = pool
+        self.metrics = metrics or default_metrics()
+        self.lock = threading.Lock()
+        self.extracted = {}
+
+    def __call__(self, job: Job):
+        image_folder = os.fspath(IMAGE_DIR / repo_dir(job.repo_url))
+        with self.lock:
+            future = self.extracted.get(job.pdf.sha256)
+            owner = future is None
+            if owner:
+                future = self.extracted[job.pdf.sha256] = Future()
+        if not owner:
+            source = future.result()
+            # A duplicate link resolves to the owner's own folder, and the
+            # folder is gone if another job for the repo found no images.
+            if os.path.abspath(source) == os.path.abspath(image_folder):
+                return
+            if not os.path.isdir(source):
+                raise ValueError("No images detected in the pdf.")
+            shutil.copytree(source, image_folder, dirs_exist_ok=True)
+            return
+        try:
+            names = self.pool.submit(
+                extract_images_from_pdf,
+                job.pdf.path,
+                image_folder,
+                image_folder,
+                cache_dir=FIGURE_CACHE_DIR,
+            ).result()
+            self.metrics.incr("images_extracted", len(names))
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(image_folder)
+
 
-    if os.path.exists(pdf_filename):
-        return pdf_filename
+def run_pipeline(
+    jobs, log_job, io_workers=4, cpu_workers=None, queue_size=16, metrics=None
+):
+    """Clone, scan, download and extract every job, overlapping the stages.
 
-    with open(pdf_filename, "wb") as f:
-        for chunk in pdf_response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-    return pdf_filename
+    Cloning and downloading run in threads; scanning and image extraction
+    run in a process pool. `log_job` is called once per job from a single
+    thread.
+    """
+    cpu_workers = cpu_workers or os.cpu_count() or 1
+    metrics = metrics or default_metrics()
+    scan_cache = ScanCache(SCAN_CACHE_DB, DETECTOR_VERSION)
+    # Trees between clone and scan must not be evicted from TMP_DIR, and a
+    # tree shared by duplicate links is only removed when no job uses it.
+    active_trees = Counter()
+    tree_locks = defaultdict(threading.Lock)
+    active_lock = threading.Lock()
+
+    def tree_lock(path):
+        with active_lock:
+            return tree_locks[str(path)]
+
+    def release_tree(path):
+        with active_lock:
+            active_trees[str(path)] -= 1
+            if active_trees[str(path)] <= 0:
+                del active_trees[str(path)]
+                return True
+            return False
+
+    # Forked pool workers would inherit the pipes of git subprocesses that
+    # clone threads are starting at that moment and hang them; workers come
+    # from a fork server instead.
+    context = (
+        multiprocessing.get_context("forkserver")
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else None
+    )
+    with ProcessPoolExecutor(max_workers=cpu_workers, mp_context=context) as pool:
+
+        def clone(job):
+            job.head_sha = remote_head(job.repo_url)
+            if job.head_sha:
+                cached = scan_cache.get(job.repo_url, job.head_sha)
+                if cached is not None and outputs_present(
+                    cached, GITHUB_DIR / repo_dir(job.repo_url)
+                ):
+                    if not cached:
+                        raise ValueError("No Plotting Code!")
+                    job.scan_cached = True
+                    metrics.outcome("clone", "skipped", "scan cached")
+                    return
+
+            clone_path = TMP_DIR / repo_dir(job.repo_url)
+            with tree_lock(clone_path):
+                with active_lock:
+                    in_use = active_trees[str(clone_path)] > 0
+                    active_trees[str(clone_path)] += 1
+                try:
+                    if (
+                        job.head_sha
+                        and not in_use
+                        and clone_path.exists()
+                        and scan_cache.tree_sha(clone_path) != job.head_sha
+                    ):
+                        scan_cache.remove_tree(clone_path)
+                    job.repo_path = clone_repo(job.repo_url, clone_path.parent)
+                    size = scan_cache.touch_tree(
+                        job.repo_path, job.repo_url, job.head_sha
+                    )
+                except BaseException:
+                    release_tree(clone_path)
+                    raise
+            metrics.add_bytes("clone", size, key=job.repo_name)
+            # Held throughout, so no tree comes into use while it is evicted.
+            with active_lock:
+                scan_cache.evict_trees(TMP_MAX_BYTES, keep=active_trees)
+
+        def scan(job):
+            if job.scan_cached:
+                return
+            try:
+                files = pool.submit(
+                    scan_repo, job.repo_path, GITHUB_DIR / repo_dir(job.repo_url)
+                ).result()
+            except BaseException:
+                release_tree(job.repo_path)
+                raise
+            if job.head_sha:
+                scan_cache.put(job.repo_url, job.head_sha, files)
+            with tree_lock(job.repo_path):
+                last_user = release_tree(job.repo_path)
+                if not files and last_user:
+                    scan_cache.remove_tree(job.repo_path)
+            if not files:
+                raise ValueError("No Plotting Code!")
+
+        def download(job):
+            job.pdf = download_pdf(
+                job.paper_url_pdf, pdf_name(job.repo_url), key=job.repo_name
+            )
+            if not job.pdf.new:
+                metrics.outcome("download", "skipped", "pdf stored")
+
+        def repo(job):
+            return job.repo_name
+
+        stages = [
+            Stage("clone", clone, io_workers, queue_size, metrics, repo),
+            Stage("scan", scan, cpu_workers, queue_size, metrics, repo),
+            Stage("download", download, io_workers, queue_size, metrics, repo),
+            Stage(
+                "images",
+                ImageExtraction(pool, metrics),
+                cpu_workers,
+                queue_size,
+                metrics,
+                repo,
+            ),
+        ]
+        try:
+            Pipeline(stages, log_job, metrics=metrics).run(jobs)
+        finally:
+            scan_cache.close()
 
 
 if __name__ == "__main__":
-    data_points = load("./links-between-papers-and-code.json.gz", fmt=Format.json_gz)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="only run the indices whose manifest status is failed",
+    )
+    parser.add_argument(
+        "--export-csv",
+        metavar="PATH",
+        nargs="?",
+        const=CSV_FILE,
+        help=f"also write the manifest as CSV (default {CSV_FILE})",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        default=METRICS_FILE,
+        help="JSON metrics file; Prometheus text goes next to it as .prom",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="STAGE",
+        action="append",
+        default=[],
+        help="profile a stage (clone, scan, download, images); repeatable",
+    )
+    parser.add_argument("--profiler", choices=PROFILERS, default="cprofile")
+    args = parser.parse_args()
 
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-            writer.writeheader()
+    metrics = configure(
+        profile_stages=args.profile, profiler=args.profiler, profile_dir=PROFILE_DIR
+    )
 
-    try:
-        df = pd.read_csv(CSV_FILE)
-        processed_indices = set(df["index"].tolist())
-    except Exception as e:
-        print("Error reading CSV log:", e)
-        processed_indices = set()
+    manifest = ManifestStore(MANIFEST_DB)
+    imported = manifest.import_csv(CSV_FILE)
+    if imported:
+        print(f"Imported {imported} rows from {CSV_FILE}")
 
     os.makedirs(DATA_DIR, exist_ok=True)
     os.makedirs(GITHUB_DIR, exist_ok=True)
@@ -109,44 +399,58 @@ if __name__ == "__main__":
     os.makedirs(PDF_DIR, exist_ok=True)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     os.makedirs(IMAGE_DIR, exist_ok=True)
+    os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
 
-    for index in range(len(data_points)):
-        # df.loc[df["index"]==0, "status"].iloc[0] == "failed"
-        if index in processed_indices:
-            continue
-
-        data = data_points[index]
-        github_url = data["repo_url"]
-        pdf_url = data["paper_url_pdf"]
-        repo_name = github_url.rstrip("/").split("/")[-1]
-        description = None
+    if args.retry_failed:
+        records = iter_records(
+            "./links-between-papers-and-code.json.gz",
+            fmt=Format.json_gz,
+            only=manifest.failed_indices(),
+        )
+    else:
+        records = iter_records(
+            "./links-between-papers-and-code.json.gz",
+            fmt=Format.json_gz,
+            skip=manifest.indices(),
+        )
 
-        try:
-            process_repo(github_url)
-            pdf_filename = download_pdf(pdf_url, repo_name)
-            extract_images_from_pdf(
-                pdf_filename,
-                os.path.join(IMAGE_DIR, repo_name),
-                os.path.join(IMAGE_DIR, repo_name),
-            )
-            # description = process_project(repo_name, GITHUB_DIR, OUTPUT_DIR)
-            status = "success"
-            error = ""
-        except Exception as e:
-            status = "failed"
-            error = str(e)
-
-        # Append to CSV
-        with open(CSV_FILE, "a", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-            writer.writerow(
-                {
-                    "index": index,
-                    "repo_url": github_url,
-                    "paper_url_pdf": pdf_url,
-                    "repo_name": repo_name,
-                    "description": description,
-                    "status": status,
-                    "error": error[: min(len(error), 100)],
-                }
+    def jobs():
+        for index, data in records:
+            github_url = data["repo_url"]
+            yield Job(
+                index=index,
+                repo_url=github_url,
+                paper_url_pdf=data["paper_url_pdf"],
+                repo_name=github_url.rstrip("/").split("/")[-1],
             )
+
+    def log_job(job: Job):
+        # description = process_project(job.repo_name, GITHUB_DIR, OUTPUT_DIR)
+        manifest.log(
+            {
+                "index": job.index,
+                "repo_url": job.repo_url,
+                "paper_url_pdf": job.paper_url_pdf,
+                "repo_name": job.repo_name,
+                "description": job.description,
+                "status": job.status,
+                "error": job.error,
+            },
+            job.timings,
+        )
+        metrics.outcome(
+            job.failed_stage or "pipeline", job.status, reason_of(job.error)
+        )
+
+    try:
+        run_pipeline(jobs(), log_job, metrics=metrics)
+    finally:
+        manifest.flush()
+        print(manifest.status_counts())
+        print(metrics.summary())
+        metrics.write(args.metrics)
+        for path in metrics.write_profiles():
+            print(f"Profile written to {path}")
+        if args.export_csv:
+            manifest.export_csv(args.export_csv)
+        manifest.close()
@@ -0,0 +1,169 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+
+MANIFEST_FIELDS = [
+    "index",
+    "repo_url",
+    "paper_url_pdf",
+    "repo_name",
+    "description",
+    "status",
+    "error",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    "index" INTEGER PRIMARY KEY,
+    repo_url TEXT,
+    paper_url_pdf TEXT,
+    repo_name TEXT,
+    description TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS manifest_repo_name ON manifest (repo_name);
+CREATE INDEX IF NOT EXISTS manifest_status ON manifest (status);
+CREATE TABLE IF NOT EXISTS timings (
+    "index" INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY ("index", stage)
+);
+"""
+
+
+class ManifestStore:
+    """SQLite (WAL) manifest of processed indices.
+
+    Rows are buffered and committed every `batch_size` rows or
+    `flush_interval` seconds. Several threads may share one store, and
+    several processes may open the same file; writers wait on each other
+    through SQLite's busy timeout.
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=5.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._rows = []
+        self._timings = []
+        self._last_flush = time.monotonic()
+
+    def log(self, row: dict, timings: dict = None):
+        """Record one index; `row` has the MANIFEST_FIELDS keys."""
+        with self._lock:
+            self._rows.append(
+                tuple(row.get(field) for field in MANIFEST_FIELDS) + (time.time(),)
+            )
+            for stage, seconds in (timings or {}).items():
+                self._timings.append((row["index"], stage, seconds))
+            if (
+                len(self._rows) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush()
+
+    def _flush(self):
+        if self._rows:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._rows,
+                )
+                # A retried index keeps none of its previous run's timings.
+                self.conn.executemany(
+                    'DELETE FROM timings WHERE "index" = ?',
+                    [(row[0],) for row in self._rows],
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO timings VALUES (?, ?, ?)", self._timings
+                )
+        self._rows = []
+        self._timings = []
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def indices(self, status=None) -> set:
+        """Indices already in the manifest, optionally only those with `status`."""
+        with self._lock:
+            self._flush()
+            if status is None:
+                rows = self.conn.execute('SELECT "index" FROM manifest')
+            else:
+                rows = self.conn.execute(
+                    'SELECT "index" FROM manifest WHERE status = ?', (status,)
+                )
+            return {index for (index,) in rows}
+
+    def failed_indices(self) -> set:
+        return self.indices(status="failed")
+
+    def status_counts(self) -> dict:
+        with self._lock:
+            self._flush()
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM manifest GROUP BY status"
+            )
+            return dict(rows.fetchall())
+
+    def stage_timings(self) -> dict:
+        """Total and mean seconds per stage."""
+        with self._lock:
+            self._flush()
+            rows = self.conn.execute(
+                "SELECT stage, SUM(seconds), AVG(seconds) FROM timings GROUP BY stage"
+            ).fetchall()
+        return {stage: {"total": total, "mean": mean} for stage, total, mean in rows}
+
+    def repos(self) -> dict:
+        """repo_name -> (repo_url, paper_url_pdf), for provenance."""
+        with self._lock:
+            self._flush()
+            rows = self.conn.execute(
+                "SELECT repo_name, repo_url, paper_url_pdf FROM manifest "
+                "WHERE repo_name IS NOT NULL"
+            )
+            return {name: (url, pdf) for name, url, pdf in rows}
+
+    def import_csv(self, csv_path):
+        """Load rows from a legacy manifest.csv that are not in the store yet."""
+        if not os.path.exists(csv_path):
+            return 0
+        known = self.indices()
+        count = 0
+        with open(csv_path, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if not row.get("index") or int(row["index"]) in known:
+                    continue
+                row["index"] = int(row["index"])
+                row["status"] = row.get("status") or "unknown"
+                self.log(row)
+                count += 1
+        self.flush()
+        return count
+
+    def export_csv(self, csv_path):
+        columns = ", ".join(f'"{field}"' for field in MANIFEST_FIELDS)
+        with self._lock, open(csv_path, "w", newline="", encoding="utf-8") as f:
+            self._flush()
+            writer = csv.writer(f)
+            writer.writerow(MANIFEST_FIELDS)
+            writer.writerows(
+                self.conn.execute(f'SELECT {columns} FROM manifest ORDER BY "index"')
+            )
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,283 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+try:
+    import pyinstrument
+except ImportError:  # optional, cProfile is always available
+    pyinstrument = None
+
+PROFILERS = ("cprofile", "pyinstrument")
+QUANTILES = (0.5, 0.95, 0.99)
+# Failure messages counted under their own reason; anything else is "other".
+KNOWN_REASONS = (
+    "No Plotting Code!",
+    "No images detected in the pdf.",
+)
+
+
+def reason_of(error) -> str:
+    if not error:
+        return ""
+    return error if error in KNOWN_REASONS else "other"
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Thread-safe run metrics: stage timings, bytes, outcomes and counters.
+
+    Timings and bytes are kept per stage, and per key (usually the repo)
+    when one is given. `profile(stage)` profiles the calling thread for
+    stages listed in `profile_stages`; work a stage hands to a process pool
+    is not seen.
+    """
+
+    def __init__(self, profile_stages=(), profiler="cprofile", profile_dir="."):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler: {profiler}")
+        if profiler == "pyinstrument" and pyinstrument is None:
+            print("pyinstrument is not installed, falling back to cProfile")
+            profiler = "cprofile"
+        self.profile_stages = set(profile_stages)
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.durations = defaultdict(list)
+        self.by_key = defaultdict(dict)
+        self.bytes = Counter()
+        self.bytes_by_key = defaultdict(Counter)
+        self.outcomes = Counter()  # (stage, outcome, reason) -> count
+        self.counters = Counter()
+        self._profiles = {}
+
+    def observe(self, stage, seconds, key=None):
+        with self._lock:
+            self.durations[stage].append(seconds)
+            if key is not None:
+                self.by_key[stage][key] = self.by_key[stage].get(key, 0) + seconds
+
+    @contextmanager
+    def timer(self, stage, key=None):
+        start = time.perf_counter()
+        try:
+            with self.profile(stage):
+                yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, key)
+
+    def add_bytes(self, stage, count, key=None):
+        with self._lock:
+            self.bytes[stage] += count
+            if key is not None:
+                self.bytes_by_key[stage][key] += count
+
+    def outcome(self, stage, outcome, reason="", count=1):
+        """Count a success, failure or skip of `stage`, by reason."""
+        if not count:
+            return
+        with self._lock:
+            self.outcomes[(stage, outcome, reason)] += count
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self.counters[name] += count
+
+    @contextmanager
+    def profile(self, stage):
+        if stage not in self.profile_stages:
+            yield
+            return
+        if self.profiler == "pyinstrument":
+            profiler = pyinstrument.Profiler(async_mode="disabled")
+            profiler.start()
+            try:
+                yield
+            finally:
+                session = profiler.stop()
+                with self._lock:
+                    previous = self._profiles.get(stage)
+                    self._profiles[stage] = (
+                        session
+                        if previous is None
+                        else pyinstrument.session.Session.combine(previous, session)
+                    )
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; calls of
+            # the stage that overlap a profiled one go unprofiled.
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                if stage in self._profiles:
+                    self._profiles[stage].add(profiler)
+                else:
+                    self._profiles[stage] = pstats.Stats(profiler)
+
+    def write_profiles(self):
+        """One file per profiled stage; returns their paths."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        paths = []
+        with self._lock:
+            profiles = dict(self._profiles)
+        for stage, profile in profiles.items():
+            if self.profiler == "pyinstrument":
+                path = os.path.join(self.profile_dir, f"{stage}.html")
+                renderer = pyinstrument.renderers.HTMLRenderer()
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(renderer.render(profile))
+            else:
+                path = os.path.join(self.profile_dir, f"{stage}.prof")
+                profile.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {}
+            for stage, values in self.durations.items():
+                stages[stage] = {
+                    "count": len(values),
+                    "total": sum(values),
+                    "mean": sum(values) / len(values),
+                    "max": max(values),
+                    **{f"p{int(q * 100)}": _quantile(values, q) for q in QUANTILES},
+                }
+            return {
+                "started": self.started,
+                "elapsed": time.time() - self.started,
+                "stages": stages,
+                "by_key": {stage: dict(keys) for stage, keys in self.by_key.items()},
+                "bytes": dict(self.bytes),
+                "bytes_by_key": {
+                    stage: dict(keys) for stage, keys in self.bytes_by_key.items()
+                },
+                "outcomes": [
+                    {"stage": s, "outcome": o, "reason": r, "count": n}
+                    for (s, o, r), n in sorted(self.outcomes.items())
+                ],
+                "counters": dict(self.counters),
+            }
+
+    def prometheus(self, prefix="pipeline") -> str:
+        snap = self.snapshot()
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, s in snap["stages"].items():
+            for q in QUANTILES:
+                lines.append(
+                    f'{prefix}_stage_seconds{{stage="{_label(stage)}",quantile="{q}"}} '
+                    f"{s[f'p{int(q * 100)}']}"
+                )
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{_label(stage)}"}} {s["total"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{_label(stage)}"}} {s["count"]}')
+        lines.append(f"# TYPE {prefix}_bytes_total counter")
+        for stage, count in snap["bytes"].items():
+            lines.append(f'{prefix}_bytes_total{{stage="{_label(stage)}"}} {count}')
+        lines.append(f"# TYPE {prefix}_outcomes_total counter")
+        for o in snap["outcomes"]:
+            lines.append(
+                f'{prefix}_outcomes_total{{stage="{_label(o["stage"])}",'
+                f'outcome="{_label(o["outcome"])}",reason="{_label(o["reason"])}"}} '
+                f'{o["count"]}'
+            )
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, count in snap["counters"].items():
+            lines.append(f'{prefix}_events_total{{name="{_label(name)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write `path` as JSON and, next to it, the Prometheus text format."""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+        prom_path = os.path.splitext(path)[0] + ".prom"
+        with open(prom_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(prom_path + ".tmp", prom_path)
+        return path, prom_path
+
+    def summary(self, slowest=5) -> str:
+        snap = self.snapshot()
+        out = [f"Run took {snap['elapsed']:.1f}s"]
+        if snap["stages"]:
+            out.append(
+                f"{'stage':<16}{'count':>7}{'total s':>10}{'mean s':>9}"
+                f"{'p50':>8}{'p95':>8}{'max':>8}{'MiB':>9}"
+            )
+            for stage, s in sorted(
+                snap["stages"].items(), key=lambda item: -item[1]["total"]
+            ):
+                mib = snap["bytes"].get(stage, 0) / 2**20
+                out.append(
+                    f"{stage:<16}{s['count']:>7}{s['total']:>10.1f}{s['mean']:>9.2f}"
+                    f"{s['p50']:>8.2f}{s['p95']:>8.2f}{s['max']:>8.2f}{mib:>9.1f}"
+                )
+        for stage, count in snap["bytes"].items():
+            if stage not in snap["stages"]:
+                out.append(f"{stage}: {count / 2**20:.1f} MiB")
+        if snap["outcomes"]:
+            out.append("Outcomes:")
+            for o in snap["outcomes"]:
+                reason = f" ({o['reason']})" if o["reason"] else ""
+                out.append(f"  {o['stage']} {o['outcome']}{reason}: {o['count']}")
+        if snap["counters"]:
+            out.append("Counters:")
+            for name, count in sorted(snap["counters"].items()):
+                out.append(f"  {name}: {count}")
+        for stage, keys in snap["by_key"].items():
+            top = sorted(keys.items(), key=lambda item: -item[1])[:slowest]
+            if top:
+                out.append(
+                    f"Slowest {stage}: "
+                    + ", ".join(f"{key} {seconds:.1f}s" for key, seconds in top)
+                )
+        for stage, keys in snap["bytes_by_key"].items():
+            top = sorted(keys.items(), key=lambda item: -item[1])[:slowest]
+            if top:
+                out.append(
+                    f"Largest {stage}: "
+                    + ", ".join(f"{key} {count / 2**20:.1f} MiB" for key, count in top)
+                )
+        return "\n".join(out)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def default_metrics() -> Metrics:
+    """The process-wide Metrics shared by every module."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def configure(**kwargs) -> Metrics:
+    """Replace the shared Metrics, e.g. to turn on profiling for some stages."""
+    global _metrics
+    with _metrics_lock:
+        _metrics = Metrics(**kwargs)
+        return _metrics
@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+import traceback
+
+_STOP = object()
+
+
+class Stage:
+    """Worker threads pulling jobs from a bounded queue.
+
+    Jobs need `status`, `error`, `failed_stage` and `timings` attributes;
+    the wall time of each stage is stored in `job.timings[stage.name]`. A
+    job that raises goes straight to the pipeline's sink with
+    `status="failed"`; otherwise it moves on to the next stage (or the sink
+    after the last one). With `metrics`, `func` runs under its profile hook
+    for the stage and its wall time is observed there too, keyed by
+    `key(job)` when `key` is given. CPU-bound stages hand their work to a
+    process pool from `func`, so the thread count bounds how many jobs they
+    have in flight.
+    """
+
+    def __init__(self, name, func, workers=1, maxsize=8, metrics=None, key=None):
+        self.name = name
+        self.func = func
+        self.metrics = metrics
+        self.key = key
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.next = None
+        self.sink = None
+        self.threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"{self.name}-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is _STOP:
+                return
+            start = time.perf_counter()
+            try:
+                if self.metrics:
+                    with self.metrics.profile(self.name):
+                        self.func(job)
+                else:
+                    self.func(job)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                job.failed_stage = self.name
+                following = self.sink
+            else:
+                following = self.next or self.sink
+            # Recorded before the hand-off: the next thread may read the job
+            # at once, and blocking on a full queue is not stage time.
+            job.timings[self.name] = time.perf_counter() - start
+            if self.metrics:
+                self.metrics.observe(
+                    self.name,
+                    job.timings[self.name],
+                    key=self.key(job) if self.key else None,
+                )
+            following.put(job)
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+
+class Pipeline:
+    """Chain of stages ending in a single sink thread.
+
+    Every job reaches `sink` exactly once, whether it fails in some stage
+    or passes all of them, and `sink` is only ever called from one thread.
+    If `sink` raises, it is called once more with the job marked failed in
+    stage "sink", so the failure can still be recorded; a job it cannot take
+    either is counted in `metrics` as lost.
+    """
+
+    def __init__(self, stages, sink, maxsize=64, metrics=None):
+        self.stages = stages
+        self.sink_func = sink
+        self.metrics = metrics
+        self.sink = queue.Queue(maxsize=maxsize)
+        for stage, following in zip(stages, stages[1:] + [None]):
+            stage.next = following.queue if following else None
+            stage.sink = self.sink
+
+    def _drain(self):
+        while True:
+            job = self.sink.get()
+            if job is _STOP:
+                return
+            if job.status is None:
+                job.status = "success"
+            # The sink must keep draining, or stages block on a full queue.
+            try:
+                self.sink_func(job)
+            except Exception as e:
+                traceback.print_exc()
+                job.status = "failed"
+                job.error = str(e)
+                job.failed_stage = "sink"
+                try:
+                    self.sink_func(job)
+                except Exception:
+                    traceback.print_exc()
+                    if self.metrics:
+                        self.metrics.outcome("sink", "failed", "lost")
+
+    def run(self, jobs):
+        sink_thread = threading.Thread(target=self._drain, name="sink", daemon=True)
+        sink_thread.start()
+        for stage in self.stages:
+            stage.start()
+        try:
+            for job in jobs:
+                self.stages[0].queue.put(job)
+        finally:
+            # Stages are closed front to back so each one has received all
+            # of its input before its workers are told to stop.
+            for stage in self.stages:
+                stage.close()
+            self.sink.put(_STOP)
+            sink_thread.join()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from git import Git
+from git.exc import GitCommandError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    repo_url TEXT NOT NULL,
+    head_sha TEXT NOT NULL,
+    detector_version INTEGER NOT NULL,
+    files TEXT NOT NULL,
+    scanned_at REAL NOT NULL,
+    PRIMARY KEY (repo_url, head_sha, detector_version)
+);
+CREATE TABLE IF NOT EXISTS trees (
+    path TEXT PRIMARY KEY,
+    repo_url TEXT NOT NULL,
+    head_sha TEXT,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trees_last_used ON trees (last_used);
+"""
+
+
+def _on_rm_error(func, path, exc_info):
+    if issubclass(exc_info[0], FileNotFoundError):
+        return  # removed by someone else meanwhile
+    try:
+        os.chmod(path, stat.S_IWRITE)
+        func(path)
+    except FileNotFoundError:
+        pass
+
+
+def remote_head(url: str) -> Optional[str]:
+    """Commit SHA of the remote's HEAD, without cloning anything."""
+    try:
+        out = Git().ls_remote(url, "HEAD")
+    except GitCommandError:
+        return None
+    return out.split()[0] if out else None
+
+
+def file_record(repo_path, py_file, output, content, library) -> dict:
+    """Scan result entry for one plotting file written as `output`."""
+    return {
+        "path": Path(py_file).relative_to(repo_path).as_posix(),
+        "output": output,
+        "sha256": hashlib.sha256(content.encode("utf8")).hexdigest(),
+        "library": library,
+    }
+
+
+def _output_matches(path, sha256) -> bool:
+    # Read back the way it was written (text, utf8), so newline translation
+    # does not change the hash.
+    try:
+        with open(path, "r", encoding="utf8") as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError):
+        return False
+    return hashlib.sha256(content.encode("utf8")).hexdigest() == sha256
+
+
+def outputs_present(files: List[dict], output_dir) -> bool:
+    """Whether every output file is in `output_dir` with its recorded content."""
+    return all(
+        _output_matches(os.path.join(output_dir, f["output"]), f["sha256"])
+        for f in files
+    )
+
+
+def tree_size(path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class ScanCache:
+    """Scan results keyed by (repo URL, HEAD SHA, detector version), plus an
+    LRU record of the working trees cloned under the temp directory.
+
+    A scan result is the list of plotting files found, each a dict with
+    `path` (relative to the repo), `output` (file name written to the
+    snippets folder), `sha256` and `library`; an empty list means the repo
+    has no plotting code.
+    """
+
+    def __init__(self, path, detector_version):
+        self.detector_version = detector_version
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+    def get(self, repo_url, head_sha) -> Optional[List[dict]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT files FROM scans WHERE repo_url = ? AND head_sha = ? "
+                "AND detector_version = ?",
+                (repo_url, head_sha, self.detector_version),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, repo_url, head_sha, files: List[dict]):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?, ?)",
+                (
+                    repo_url,
+                    head_sha,
+                    self.detector_version,
+                    json.dumps(files),
+                    time.time(),
+                ),
+            )
+
+    def tree_sha(self, path) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT head_sha FROM trees WHERE path = ?", (str(path),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def touch_tree(self, path, repo_url, head_sha) -> int:
+        """Record a working tree as just used; returns its re-measured size."""
+        size = tree_size(path)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO trees VALUES (?, ?, ?, ?, ?)",
+                (str(path), repo_url, head_sha, size, time.time()),
+            )
+        return size
+
+    def remove_tree(self, path):
+        """Delete a working tree and its record; a tree already gone is fine."""
+        if os.path.lexists(path):
+            shutil.rmtree(path, onerror=_on_rm_error)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM trees WHERE path = ?", (str(path),))
+
+    def evict_trees(self, max_bytes, keep=()) -> List[str]:
+        """Delete least recently used trees until they fit in `max_bytes`.
+
+        Evictions run one at a time. Trees in `keep` are never deleted; a
+        caller whose trees come into use concurrently must hold the lock
+        guarding `keep` for the whole call.
+        """
+        with self._evict_lock:
+            keep = {str(path) for path in keep}
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT path, size FROM trees ORDER BY last_used"
+                ).fetchall()
+            total = sum(size for _, size in rows)
+            evicted = []
+            for path, size in rows:
+                if total <= max_bytes:
+                    break
+                if path in keep:
+                    continue
+                self.remove_tree(path)
+                total -= size
+                evicted.append(path)
+            return evicted
+
+    def close(self):
+        self.conn.close()
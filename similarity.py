@@ -0,0 +1,336 @@
+import argparse
+import glob
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+SCORE_SIZE = 256  # both images of a pair are compared at SCORE_SIZE x SCORE_SIZE
+CHUNK_SIZE = 32  # pairs per pool task
+SSIM_RADIUS = 3  # 7x7 window
+HIST_BINS = 8  # per channel
+EDGE_THRESHOLD = 0.1  # of the largest possible Sobel magnitude
+WEIGHTS = {"ssim": 0.4, "histogram": 0.3, "edges": 0.3}
+INDEX_FILE = "similarity.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    original TEXT PRIMARY KEY,
+    replicated TEXT NOT NULL,
+    project TEXT NOT NULL,
+    replicated_mtime REAL NOT NULL,
+    ssim REAL NOT NULL,
+    histogram REAL NOT NULL,
+    edges REAL NOT NULL,
+    score REAL NOT NULL,
+    scored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_score ON scores (score);
+"""
+
+
+def find_pairs(output_dir):
+    """(project, original, replicated) for every replicated figure."""
+    pairs = []
+    pattern = os.path.join(output_dir, "*", "*_replicated.png")
+    for replicated in sorted(glob.glob(pattern)):
+        base = replicated[: -len("_replicated.png")]
+        originals = [p for p in glob.glob(glob.escape(base) + "_original.*")]
+        if originals:
+            project = os.path.basename(os.path.dirname(replicated))
+            pairs.append((project, originals[0], replicated))
+    return pairs
+
+
+def _load(path):
+    with Image.open(path) as img:
+        img.draft("RGB", (SCORE_SIZE, SCORE_SIZE))
+        size = (SCORE_SIZE, SCORE_SIZE)
+        if img.mode in ("RGBA", "LA", "P"):
+            # Transparent areas render as white; composited after the
+            # resize, which is cheaper at this size.
+            img = img.convert("RGBA").resize(size, Image.BOX)
+            background = Image.new("RGBA", size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img)
+        img = img.convert("RGB").resize(size, Image.BOX)
+    return np.asarray(img)
+
+
+def _box_mean(x, r):
+    """Mean over (2r+1)^2 windows of a (N, H, W) batch, valid region only."""
+    w = 2 * r + 1
+    c = np.pad(x, ((0, 0), (1, 0), (1, 0))).cumsum(axis=1).cumsum(axis=2)
+    return (c[:, w:, w:] - c[:, :-w, w:] - c[:, w:, :-w] + c[:, :-w, :-w]) / (w * w)
+
+
+def ssim(a, b):
+    """Mean SSIM per image of two (N, H, W) gray batches in 0..255."""
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    mu_a = _box_mean(a, SSIM_RADIUS)
+    mu_b = _box_mean(b, SSIM_RADIUS)
+    var_a = _box_mean(a * a, SSIM_RADIUS) - mu_a * mu_a
+    var_b = _box_mean(b * b, SSIM_RADIUS) - mu_b * mu_b
+    cov = _box_mean(a * b, SSIM_RADIUS) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / (
+        (mu_a * mu_a + mu_b * mu_b + c1) * (var_a + var_b + c2)
+    )
+    return ssim_map.reshape(len(a), -1).mean(axis=1)
+
+
+def histogram_similarity(a, b):
+    """Intersection of normalized color histograms of two (N, H, W, 3) batches."""
+    n = len(a)
+    bins = HIST_BINS**3
+
+    def histograms(rgb):
+        q = (rgb // (256 // HIST_BINS)).astype(np.int64)
+        codes = (q[..., 0] * HIST_BINS + q[..., 1]) * HIST_BINS + q[..., 2]
+        codes = codes.reshape(n, -1) + (np.arange(n) * bins)[:, None]
+        counts = np.bincount(codes.ravel(), minlength=n * bins).reshape(n, bins)
+        return counts / counts.sum(axis=1, keepdims=True)
+
+    return np.minimum(histograms(a), histograms(b)).sum(axis=1)
+
+
+def _edges(gray):
+    gx = (
+        gray[:, :-2, 2:] + 2 * gray[:, 1:-1, 2:] + gray[:, 2:, 2:]
+        - gray[:, :-2, :-2] - 2 * gray[:, 1:-1, :-2] - gray[:, 2:, :-2]
+    )
+    gy = (
+        gray[:, 2:, :-2] + 2 * gray[:, 2:, 1:-1] + gray[:, 2:, 2:]
+        - gray[:, :-2, :-2] - 2 * gray[:, :-2, 1:-1] - gray[:, :-2, 2:]
+    )
+    return np.hypot(gx, gy) > EDGE_THRESHOLD * 4 * 255 * np.sqrt(2)
+
+
+def _dilate(mask):
+    out = mask.copy()
+    out[:, 1:] |= mask[:, :-1]
+    out[:, :-1] |= mask[:, 1:]
+    out[:, :, 1:] |= mask[:, :, :-1]
+    out[:, :, :-1] |= mask[:, :, 1:]
+    return out
+
+
+def edge_similarity(a, b):
+    """F1 of the two edge maps, matching edges within one pixel."""
+    n = len(a)
+    ea, eb = _edges(a), _edges(b)
+    hits_a = (ea & _dilate(eb)).reshape(n, -1).sum(axis=1)
+    hits_b = (eb & _dilate(ea)).reshape(n, -1).sum(axis=1)
+    count_a = ea.reshape(n, -1).sum(axis=1)
+    count_b = eb.reshape(n, -1).sum(axis=1)
+    precision = np.where(count_b > 0, hits_b / np.maximum(count_b, 1), 0.0)
+    recall = np.where(count_a > 0, hits_a / np.maximum(count_a, 1), 0.0)
+    f1 = np.where(
+        precision + recall > 0,
+        2 * precision * recall / np.maximum(precision + recall, 1e-9),
+        0.0,
+    )
+    # Two blank images are identical.
+    return np.where((count_a == 0) & (count_b == 0), 1.0, f1)
+
+
+def score_batch(originals, replicas):
+    """Scores of (N, H, W, 3) uint8 batches, each an array of length N."""
+    gray_weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    ga = originals.astype(np.float32) @ gray_weights
+    gb = replicas.astype(np.float32) @ gray_weights
+    scores = {
+        "ssim": ssim(ga, gb),
+        "histogram": histogram_similarity(originals, replicas),
+        "edges": edge_similarity(ga, gb),
+    }
+    scores["score"] = sum(WEIGHTS[name] * scores[name] for name in WEIGHTS)
+    return scores
+
+
+def _score_chunk(shm_name, shape, bounds):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        images = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        start, stop = bounds
+        scores = score_batch(images[start:stop, 0], images[start:stop, 1])
+        return {name: values.tolist() for name, values in scores.items()}
+    finally:
+        shm.close()
+
+
+def _load_chunk(pairs, pool):
+    """Decode and resize `pairs` into a new shared memory segment; returns
+    it with the array shape and a mask of the pairs that could be read."""
+    shape = (len(pairs), 2, SCORE_SIZE, SCORE_SIZE, 3)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    images = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    readable = np.ones(len(pairs), dtype=bool)
+
+    def load(i):
+        try:
+            images[i, 0] = _load(pairs[i][0])
+            images[i, 1] = _load(pairs[i][1])
+        except (OSError, ValueError):
+            readable[i] = False
+
+    try:
+        list(pool.map(load, range(len(pairs))))
+    except BaseException:
+        images = load = None  # the buffer cannot close while a view is alive
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, shape, readable
+
+
+def score_pairs(pairs, workers=None, chunk_size=CHUNK_SIZE):
+    """Score (original, replicated) path pairs; returns one dict per pair.
+
+    Each chunk of pairs is decoded and resized by a thread pool into its own
+    shared memory segment, which a process pool then scores. At most
+    `workers` chunks are held at once, so shared memory stays bounded by
+    the chunk size rather than the number of pairs.
+    """
+    if not pairs:
+        return []
+    bounds = [
+        (start, min(start + chunk_size, len(pairs)))
+        for start in range(0, len(pairs), chunk_size)
+    ]
+    parallel = len(bounds) > 1 and workers != 1
+    in_flight = (workers or os.cpu_count() or 1) if parallel else 1
+    results = [None] * len(pairs)
+    pending = deque()
+
+    def collect():
+        start, shm, readable, future = pending.popleft()
+        try:
+            chunk = future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+        for i, values in enumerate(zip(*chunk.values())):
+            if readable[i]:
+                results[start + i] = dict(zip(chunk, values))
+
+    with ThreadPoolExecutor(max_workers=workers) as loaders, (
+        ProcessPoolExecutor(max_workers=workers) if parallel else nullcontext()
+    ) as pool:
+        try:
+            for start, stop in bounds:
+                shm, shape, readable = _load_chunk(pairs[start:stop], loaders)
+                score = partial(_score_chunk, shm.name, shape, (0, stop - start))
+                if pool:
+                    future = pool.submit(score)
+                else:
+                    future = Future()
+                    try:
+                        future.set_result(score())
+                    except Exception as e:
+                        future.set_exception(e)
+                pending.append((start, shm, readable, future))
+                while len(pending) >= in_flight:
+                    collect()
+            while pending:
+                collect()
+        finally:
+            for _, shm, _, future in pending:
+                future.cancel()
+                shm.close()
+                shm.unlink()
+    return results
+
+
+class SimilarityIndex:
+    """Scores per original figure in SQLite, for filtering the dataset."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def scored(self) -> dict:
+        """replicated path -> mtime it was scored at."""
+        rows = self.conn.execute("SELECT replicated, replicated_mtime FROM scores")
+        return dict(rows.fetchall())
+
+    def put(self, rows):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def passing(self, min_score):
+        """(project, original, replicated, score) of pairs scoring at least `min_score`."""
+        return self.conn.execute(
+            "SELECT project, original, replicated, score FROM scores "
+            "WHERE score >= ? ORDER BY project, original",
+            (min_score,),
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def score_outputs(output_dir, workers=None, index_path=None):
+    """Score every new or changed pair under `output_dir` into its index."""
+    index = SimilarityIndex(index_path or os.path.join(output_dir, INDEX_FILE))
+    try:
+        scored = index.scored()
+        pairs = [
+            (project, original, replicated)
+            for project, original, replicated in find_pairs(output_dir)
+            if scored.get(replicated) != os.path.getmtime(replicated)
+        ]
+        results = score_pairs([(o, r) for _, o, r in pairs], workers)
+        now = time.time()
+        index.put(
+            (
+                original,
+                replicated,
+                project,
+                os.path.getmtime(replicated),
+                result["ssim"],
+                result["histogram"],
+                result["edges"],
+                result["score"],
+                now,
+            )
+            for (project, original, replicated), result in zip(pairs, results)
+            if result is not None
+        )
+        return len(pairs)
+    finally:
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score replicated figures against the originals"
+    )
+    parser.add_argument("output_dir", nargs="?", default="./data/output")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--min-score", type=float, default=None, help="list pairs scoring at least this"
+    )
+    args = parser.parse_args()
+
+    count = score_outputs(args.output_dir, args.workers)
+    print(f"Scored {count} new or changed pairs")
+    if args.min_score is not None:
+        index = SimilarityIndex(os.path.join(args.output_dir, INDEX_FILE))
+        for project, original, replicated, score in index.passing(args.min_score):
+            print(f"{score:.3f}  {project}  {os.path.basename(original)}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import os
+
+from benchmarks.bench_loader import measure, write_dump
+from main import Format, iter_records
+
+RECORDS = 100_000  # about 40 MiB of JSON once decompressed
+MAX_STREAMING_MB = 16.0
+
+
+def test_iter_records_streams_large_dump(tmp_path):
+    path = os.fspath(tmp_path / "links.json.gz")
+    write_dump(path, RECORDS)
+
+    count, _, peak = measure(
+        lambda: sum(1 for _ in iter_records(path, fmt=Format.json_gz))
+    )
+
+    assert count == RECORDS
+    assert peak / 2**20 < MAX_STREAMING_MB
+
+
+def test_iter_records_skip_and_only(tmp_path):
+    path = os.fspath(tmp_path / "links.json.gz")
+    write_dump(path, 10)
+
+    indices = [i for i, _ in iter_records(path, skip={0, 2}, only={1, 2, 5})]
+    records = dict(iter_records(path))
+
+    assert indices == [1, 5]
+    assert records[7]["repo_url"] == "https://github.com/owner7/repo-7"
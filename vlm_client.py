@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from http_client import RETRY_STATUSES
+from metrics import default_metrics
+from rate_limit import TokenBucket
+
+IMAGE_TOKENS = 258  # what Gemini bills for an image of up to 384x384
+CHARS_PER_TOKEN = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def _parts(contents):
+    for message in contents:
+        yield from message["parts"]
+
+
+def request_key(model, contents, schema) -> str:
+    """Cache key from the model, the response schema, and the hash of every
+    prompt text and image in order."""
+    schema_json = json.dumps(schema.model_json_schema(), sort_keys=True)
+    digest = hashlib.sha256(f"{model}\0{schema_json}".encode("utf-8"))
+    for part in _parts(contents):
+        if "text" in part:
+            digest.update(b"\0t" + hashlib.sha256(part["text"].encode("utf-8")).digest())
+        else:
+            data = part["inline_data"]["data"]
+            digest.update(b"\0i" + hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+
+def estimate_tokens(contents) -> int:
+    tokens = 0
+    for part in _parts(contents):
+        if "text" in part:
+            tokens += len(part["text"]) // CHARS_PER_TOKEN + 1
+        else:
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+def _status(error):
+    return getattr(error, "code", None) or getattr(error, "status_code", None)
+
+
+class ResponseCache:
+    """Response texts in SQLite (WAL), keyed by request_key."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT text FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, model, text):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, model, text, time.time()),
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+class VlmClient:
+    """Async scheduler around a genai-style `client.models.generate_content`.
+
+    At most `concurrency` requests are in flight, requests and estimated
+    tokens are paced to `rpm` and `tpm` (0 disables a limit), quota and
+    server errors are retried with full-jitter backoff, and responses are
+    cached so a rerun sends nothing that already succeeded.
+    """
+
+    def __init__(
+        self,
+        client,
+        model,
+        concurrency=4,
+        rpm=60,
+        tpm=250_000,
+        cache_path=None,
+        max_retries=5,
+        backoff=2.0,
+        max_backoff=60,
+        metrics=None,
+    ):
+        self.client = client
+        self.model = model
+        self.concurrency = concurrency
+        self.requests = TokenBucket(rpm / 60, burst=concurrency)
+        self.tokens = TokenBucket(tpm / 60, burst=tpm / 6)
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.calls = 0
+        self.cache_hits = 0
+        self.metrics = metrics or default_metrics()
+        self._semaphore = None
+        # asyncio.to_thread's default pool can be smaller than `concurrency`.
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def _retryable(self, error):
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        return _status(error) in RETRY_STATUSES
+
+    def _reason(self, error):
+        code = _status(error)
+        return f"http {code}" if code else type(error).__name__
+
+    def _delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    async def _call(self, contents, schema):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        tokens = estimate_tokens(contents)
+        size = sum(
+            len(part["text"]) if "text" in part else len(part["inline_data"]["data"])
+            for part in _parts(contents)
+        )
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self.requests.acquire()
+                await self.tokens.acquire(tokens)
+                self.calls += 1
+                self.metrics.add_bytes("gemini", size)
+                start = time.perf_counter()
+                try:
+                    response = await asyncio.get_running_loop().run_in_executor(
+                        self._executor,
+                        partial(
+                            self.client.models.generate_content,
+                            model=self.model,
+                            contents=contents,
+                            config={
+                                "response_mime_type": "application/json",
+                                "response_schema": schema,
+                            },
+                        ),
+                    )
+                    self.metrics.outcome("gemini", "success")
+                    return response.text
+                except Exception as e:
+                    if not self._retryable(e) or attempt == self.max_retries:
+                        self.metrics.outcome("gemini", "failed", self._reason(e))
+                        raise
+                    self.metrics.outcome("gemini", "retried", self._reason(e))
+                finally:
+                    self.metrics.observe("gemini", time.perf_counter() - start)
+            await asyncio.sleep(self._delay(attempt))
+
+    async def generate(self, contents, schema):
+        """Response to `contents` parsed into the pydantic model `schema`."""
+        key = request_key(self.model, contents, schema)
+        text = self.cache.get(key) if self.cache else None
+        if text is not None:
+            self.cache_hits += 1
+            self.metrics.outcome("gemini", "skipped", "cached")
+            return schema.model_validate_json(text)
+        text = await self._call(contents, schema)
+        parsed = schema.model_validate_json(text)
+        if self.cache:
+            self.cache.put(key, self.model, text)
+        return parsed
+
+    def close(self):
+        self._executor.shutdown()
+        if self.cache:
+            self.cache.close()